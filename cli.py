@@ -0,0 +1,282 @@
+import argparse
+import sys
+from pathlib import Path
+
+# heavy modules (pandas, pypdf, tabula) are imported inside the subcommands,
+# so --help and discovery start without them
+sys.path.insert(0, str(Path(__file__).parent / "ppys"))
+
+
+# per parse mode, as in the main.*_payslips defaults; stream needs an append-only sink
+DEFAULT_OUTPUTS = {
+    "batch": "output.xlsx",
+    "stream": "output.csv",
+    "sync": "output.parquet",
+    "isolated": "output.xlsx",
+}
+
+
+def cmd_parse(args: argparse.Namespace) -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()  # PASSWORD / PASSWORD_FILE for encrypted payslips
+    import main
+
+    options = dict(
+        backend_name=args.backend,
+        workers=args.workers,
+        roots=args.roots,
+        exclude=tuple(args.exclude),
+        cache_max_entries=args.cache_max_entries,
+        cache_max_age_days=args.cache_max_age_days,
+    )
+    if args.output is None:
+        args.output = DEFAULT_OUTPUTS[args.mode]
+    if args.mode == "isolated":
+        main.load_payslips_isolated(
+            output=args.output,
+            xlsx=args.xlsx,
+            timings=args.timings,
+            file_timeout=args.file_timeout,
+            retries=args.retries,
+            **options,
+        )
+        return
+    if args.mode == "stream":
+        main.stream_payslips(args.output, timings=args.timings, **options)
+        return
+    options.update(history=args.history, employee=args.employee)
+    if args.mode == "sync":
+        main.sync_payslips(output=args.output, **options)
+    else:
+        main.load_payslips(
+            output=args.output, xlsx=args.xlsx, timings=args.timings, **options
+        )
+
+
+def cmd_find(args: argparse.Namespace) -> None:
+    import archives
+    import discovery
+
+    for root in args.roots:
+        if archives.is_archive(root):
+            for member in archives.iter_members(Path(root), exclude=args.exclude):
+                print(f"{root}:{member.filepath}")
+        else:
+            for fp in discovery.walk_payslips([root], exclude=args.exclude):
+                print(fp)
+
+
+def cmd_export(args: argparse.Namespace) -> None:
+    import export
+
+    df = export.read_frame(Path(args.input))
+    export.export_frame(df, Path(args.output), xlsx=args.xlsx)
+
+
+def cmd_stats(args: argparse.Namespace) -> None:
+    if args.cache:
+        from cache import PayslipCache
+
+        filepath = Path(args.cache)
+        if not filepath.is_file():
+            print(f"no cache at {filepath}")
+        else:
+            # as it is: no eviction, nothing written
+            with PayslipCache(filepath, read_only=True) as cache:
+                for name, n in cache.counts().items():
+                    print(f"{name}: {n}")
+    if args.timings:
+        import instrument
+
+        stats = instrument.read_jsonl(Path(args.timings))
+        df = instrument.summary(stats)
+        print(df)
+        print(f"counters: {df.attrs.get('counters', {})}")
+        print(instrument.slowest(stats, n=args.top))
+
+
+def cmd_quarantine(args: argparse.Namespace) -> None:
+    from scheduler import QUARANTINE_FILENAME, Quarantine
+
+    # where parse --mode isolated keeps it, see utils.PathFinder.cwd
+    filepath = Path(args.store or Path(__file__).parent / QUARANTINE_FILENAME)
+    if not filepath.is_file():
+        print(f"no quarantine at {filepath}")
+        return
+    with Quarantine(filepath) as quarantine:
+        if args.release is not None:
+            n = quarantine.release(args.release or None)
+            print(f"released {n} payslips")
+        for path, error_type, reason, attempts in quarantine.entries():
+            print(f"{path}: {error_type} {reason} ({attempts} attempts)")
+
+
+def cmd_history(args: argparse.Namespace) -> None:
+    from history import HistoryStore
+
+    with HistoryStore(Path(args.store)) as store:
+        if args.add:
+            import export
+
+            store.add_frame(export.read_frame(Path(args.add)), args.employee or "")
+        if args.ytd:
+            print(store.year_to_date(args.ytd, args.employee))
+        elif args.show == "payslips":
+            print(store.payslips(args.employee, args.start, args.end))
+        elif args.show:
+            print(store.rollup(args.show, args.employee, args.start, args.end))
+
+
+def cmd_bench(args: argparse.Namespace) -> None:
+    import bench
+
+    print(bench.bench_imports())
+    if not args.imports_only:
+        print(bench.bench_amounts())
+        print(bench.bench_tables())
+        sizes = tuple(args.sizes) or bench.SIZES
+        print(bench.bench_pipeline(sizes, backend_name=args.backend).T)
+
+
+def cmd_profile(args: argparse.Namespace) -> None:
+    import main
+
+    main.profile_payslip(Path(args.file), backend_name=args.backend, tool=args.tool)
+
+
+def cmd_serve(args: argparse.Namespace) -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    import service
+
+    service.serve(
+        host=args.host,
+        port=args.port,
+        path=args.socket,
+        backend_name=args.backend,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        batch_wait=args.batch_wait_ms / 1000,
+        max_pending=args.max_pending,
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="ppys", description="parse payslips")
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="only log warnings and errors"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("parse", help="parse payslips into one output file")
+    p.add_argument("roots", nargs="*", help="directories or zip/tar archives")
+    p.add_argument(
+        "-o", "--output", default=None, help="default: output.<xlsx|csv|parquet>"
+    )
+    p.add_argument("-b", "--backend", default="", help="subprocess, jvm or text")
+    p.add_argument("-w", "--workers", type=int, default=1, help="0: all cpus")
+    p.add_argument("-x", "--exclude", action="append", default=[], help="glob")
+    p.add_argument(
+        "--mode", choices=["batch", "stream", "sync", "isolated"], default="batch"
+    )
+    p.add_argument("--xlsx", action="store_true", help="also write an Excel copy")
+    p.add_argument("--timings", default="", help="per-file timings (json lines)")
+    p.add_argument(
+        "--file-timeout", type=float, default=120, help="isolated: s per payslip"
+    )
+    p.add_argument("--retries", type=int, default=1, help="isolated: on timeouts")
+    p.add_argument("--history", default="", help="also file into this store")
+    p.add_argument("--employee", default="", help="employee in the history")
+    p.add_argument(
+        "--cache-max-entries",
+        type=int,
+        default=0,
+        help="keep at most N cached payslips (0: no limit)",
+    )
+    p.add_argument(
+        "--cache-max-age-days",
+        type=float,
+        default=0,
+        help="drop cached payslips unused for D days (0: never)",
+    )
+    p.set_defaults(func=cmd_parse)
+
+    p = sub.add_parser("find", help="list the payslips that parse would read")
+    p.add_argument("roots", nargs="+")
+    p.add_argument("-x", "--exclude", action="append", default=[], help="glob")
+    p.set_defaults(func=cmd_find)
+
+    p = sub.add_parser("export", help="convert an output file to another format")
+    p.add_argument("input")
+    p.add_argument("output")
+    p.add_argument("--xlsx", action="store_true", help="also write an Excel copy")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("stats", help="summarize timings and the parse cache")
+    p.add_argument("--timings", default="", help="json lines from parse --timings")
+    p.add_argument("--cache", default="", help="cache file, e.g. .ppys_cache.sqlite")
+    p.add_argument("--top", type=int, default=10, help="slowest payslips to show")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("quarantine", help="list or release quarantined payslips")
+    p.add_argument("store", nargs="?", default="", help="default: next to cli.py")
+    p.add_argument(
+        "--release",
+        nargs="*",
+        default=None,
+        metavar="PATH",
+        help="let these payslips (default: all) be parsed again",
+    )
+    p.set_defaults(func=cmd_quarantine)
+
+    p = sub.add_parser("history", help="query or fill the payslip history store")
+    p.add_argument("store", nargs="?", default="ppys_history.sqlite")
+    p.add_argument("--add", default="", help="output file to file into the store")
+    p.add_argument("--employee", default=None, help="default: everyone")
+    p.add_argument(
+        "--show", choices=["payslips", "monthly", "yearly"], default="yearly"
+    )
+    p.add_argument("--start", default=None, help="2022-01-01, 2022-01 or 2022")
+    p.add_argument("--end", default=None)
+    p.add_argument("--ytd", default="", help="year to date totals up to 2022-06")
+    p.set_defaults(func=cmd_history)
+
+    p = sub.add_parser("bench", help="benchmark on synthetic payslips")
+    p.add_argument("sizes", nargs="*", type=int)
+    p.add_argument("-b", "--backend", default="text")
+    p.add_argument("--imports-only", action="store_true")
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("serve", help="parse uploaded payslips over local http")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8750)
+    p.add_argument("--socket", default="", help="unix socket path instead of tcp")
+    p.add_argument("-b", "--backend", default="", help="subprocess, jvm or text")
+    p.add_argument("-w", "--workers", type=int, default=1)
+    p.add_argument("--batch-size", type=int, default=16)
+    p.add_argument("--batch-wait-ms", type=float, default=20)
+    p.add_argument("--max-pending", type=int, default=256, help="then 503")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("profile", help="profile the parse of one payslip")
+    p.add_argument("file")
+    p.add_argument("-b", "--backend", default="")
+    p.add_argument("--tool", choices=["cprofile", "pyinstrument"], default="cprofile")
+    p.set_defaults(func=cmd_profile)
+    return parser
+
+
+def main(argv=None) -> None:
+    args = build_parser().parse_args(argv)
+    if args.quiet:
+        import logging
+
+        # utils.init_logger keeps a level set before it runs
+        logging.getLogger("ppys").setLevel(logging.WARNING)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import math
+from decimal import Decimal
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def is_blank(value) -> bool:
+    """
+    an empty cell: None, NaN, <NA> or whitespace
+    """
+    if value is None or value is pd.NA or (isinstance(value, float) and value != value):
+        return True
+    return str(value).strip() == ""
+
+
+SHORT_COLUMN = 64  # below this, per cell beats the string vectorization
+# amounts are stored as int64 cents, anything as large becomes <NA>
+CENTS_BOUND = 2**63
+
+
+def parse_amount(value) -> Optional[int]:
+    """
+    parse_amounts for a single cell, None where parse_amounts gives <NA>
+    """
+    if is_blank(value):
+        return None
+    text = str(value).replace(",", "").strip()
+    negate = text.endswith("-")
+    if negate:
+        text = text[:-1]
+    if "_" in text or not text.isascii():
+        return None  # float() takes "1_000" and other digits, to_numeric not
+    try:
+        scaled = float(text) * 100
+    except ValueError:
+        return None
+    if not math.isfinite(scaled):
+        return None
+    cents = round(scaled)
+    if abs(scaled - cents) >= 1e-6 or abs(cents) >= CENTS_BOUND:
+        return None
+    return -cents if negate else cents
+
+
+def parse_amounts(values: pd.Series) -> pd.Series:
+    """
+    parse a whole column of printed amounts into exact int64 cents
+    handles "1,234.50", "+12.00", "-3.5", "3.50-" (trailing minus) and floats
+    blanks, unparsable cells, amounts with more than 2 decimals and amounts
+    out of the int64 range become <NA>
+    """
+    if len(values) < SHORT_COLUMN:
+        return pd.Series(
+            [parse_amount(x) for x in values], index=values.index, dtype="Int64"
+        )
+    text = values.astype("string").str.replace(",", "", regex=False).str.strip()
+    trailing_minus = text.str.endswith("-").fillna(False)
+    text = text.mask(trailing_minus, text.str[:-1])
+    scaled = pd.to_numeric(text, errors="coerce").astype("float64") * 100
+    cents = np.rint(scaled)
+    # exact for 2-decimal amounts far beyond any payslip (< 2**53 cents)
+    exact = ((scaled - cents).abs() < 1e-6) & (cents.abs() < CENTS_BOUND)
+    cents = cents.where(exact).astype("Int64")
+    return cents.mask(trailing_minus, -cents)
+
+
+def cents_to_decimal(cents: int) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def decimal_to_cents(value: Decimal) -> int:
+    return int(value.scaleb(2).to_integral_value())
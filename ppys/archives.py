@@ -0,0 +1,62 @@
+import tarfile
+import zipfile
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Union
+
+import utils
+from discovery import DEFAULT_INCLUDE
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+class Member(NamedTuple):
+    """
+    a payslip inside an archive, named by its member name
+    """
+
+    filepath: Path
+    data: bytes
+
+
+def is_archive(filepath: Union[str, Path]) -> bool:
+    return str(filepath).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _wanted(name: str, include: tuple[str, ...], exclude: tuple[str, ...]) -> bool:
+    return any(fnmatchcase(name, p) for p in include) and not any(
+        fnmatchcase(name, p) for p in exclude
+    )
+
+
+def iter_members(
+    archive: Path,
+    include: Iterable[str] = DEFAULT_INCLUDE,
+    exclude: Iterable[str] = (),
+) -> Iterator[Member]:
+    """
+    yield the payslips of a zip or tar archive one at a time, read into memory
+    without extracting anything to disk; tars are read as a stream, so
+    compressed tars are decompressed once front to back
+    """
+    include, exclude = tuple(include), tuple(exclude)
+    n = 0
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and _wanted(info.filename, include, exclude):
+                    n += 1
+                    yield Member(Path(info.filename), zf.read(info))
+    else:
+        with tarfile.open(archive, "r|*") as tf:
+            for info in tf:
+                if info.isfile() and _wanted(info.name, include, exclude):
+                    reader = tf.extractfile(info)
+                    if reader is not None:
+                        n += 1
+                        yield Member(Path(info.name), reader.read())
+    lg.info("read %d payslips from %s", n, archive.name)
@@ -0,0 +1,464 @@
+import atexit
+import io
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from pypdf import PdfReader
+
+import utils
+import decrypt
+import instrument
+
+try:
+    import tabula
+    from tabula.backend import TabulaVm
+    from tabula.file_util import localize_file
+    from tabula.util import TabulaOption
+except ImportError:  # only the text backend is usable without tabula
+    tabula = None
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+
+_jvm_shut_down = False
+
+
+class BackendUnavailable(Exception):
+    pass
+
+
+def _unique_columns(columns: list) -> list[str]:
+    """
+    name missing headers "Unnamed: 0", "Unnamed: 1", ... (a running count) and
+    suffix repeated ones ".1", ".2", ... as tabula-py does
+    """
+    unnamed = iter(range(len(columns)))
+    names = [f"Unnamed: {next(unnamed)}" if pd.isna(col) else col for col in columns]
+    counts: dict[str, int] = {}
+    res = []
+    for col in names:
+        n = counts.get(col, 0)
+        while n > 0:
+            counts[col] = n + 1
+            col = f"{col}.{n}"
+            n = counts.get(col, 0)
+        res.append(col)
+        counts[col] = n + 1
+    return res
+
+
+def table_to_dataframe(table: dict, header: Optional[int] = None) -> pd.DataFrame:
+    """
+    convert one tabula-java json table into a DataFrame
+    mirrors tabula.io.read_pdf(pandas_options={"header": header}): empty cells
+    are NaN, header names unique
+    """
+    rows = [[e["text"] if e["text"] else np.nan for e in row] for row in table["data"]]
+    if not rows:
+        return pd.DataFrame()
+    columns = None
+    if header is not None:
+        columns = _unique_columns(rows.pop(header))
+    df = pd.DataFrame(data=rows, columns=columns)
+    for c in df.columns:
+        try:
+            df[c] = pd.to_numeric(df[c], errors="raise")
+        except (ValueError, TypeError):
+            pass
+    return df
+
+
+class TabulaBackend:
+    """
+    tabula-java launched as a fresh subprocess for every extraction
+    """
+
+    name = "subprocess"
+    needs_reader = False
+
+    def __init__(self) -> None:
+        if tabula is None:
+            raise BackendUnavailable(f"{self.name} backend requires tabula-py")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    def json_tables(self, filepath, area: list) -> list[dict]:
+        """
+        the raw tabula-java json tables of page 1 within area, a relative
+        [top, left, bottom, right] in % of the page or a list of them
+        stream mode gives exactly one table per area, in area order: left to
+        decide, tabula-java uses lattice on ruled areas, which splits an
+        area into several tables or finds none
+        """
+        return tabula.io.read_pdf(
+            filepath,
+            pages=[1],
+            output_format="json",
+            area=area,
+            relative_area=True,  # enables % from area argument
+            stream=True,
+            force_subprocess=True,
+        )
+
+    def read_area(
+        self,
+        filepath,
+        area: list[float],
+        header: Optional[int] = None,
+    ) -> pd.DataFrame:
+        tables = self.json_tables(filepath, area)
+        if not isinstance(tables, list) or not tables:
+            return pd.DataFrame()
+        return table_to_dataframe(tables[0], header=header)
+
+    def extract(
+        self,
+        filepath,
+        areas: dict[str, list[float]],
+        headers: Optional[dict[str, int]] = None,
+    ) -> dict[str, pd.DataFrame]:
+        """
+        extract every named area of page 1 in a single tabula pass
+        an encrypted pdf must come decrypted (see decrypt.decrypted_copy), a
+        password would sit in the java command line for anyone to read
+        returns {area_name: DataFrame}, empty DataFrame for empty areas
+        """
+        headers = headers if headers else {}
+        with instrument.stage("area:all"):
+            # one raw table per area in stream mode, empty ones included
+            raw_tables = self.json_tables(filepath, list(areas.values()))
+        if not isinstance(raw_tables, list) or len(raw_tables) != len(areas):
+            lg.warning(
+                "single pass returned %s tables for %d areas, "
+                "falling back to one call per area",
+                (
+                    len(raw_tables)
+                    if isinstance(raw_tables, list)
+                    else type(raw_tables).__name__
+                ),
+                len(areas),
+            )
+            tables = {}
+            for name, area in areas.items():
+                with instrument.stage(f"area:{name}"):
+                    tables[name] = self.read_area(
+                        filepath, area, header=headers.get(name)
+                    )
+            return tables
+        return {
+            name: table_to_dataframe(table, header=headers.get(name))
+            for name, table in zip(areas, raw_tables)
+        }
+
+
+class PersistentTabulaBackend(TabulaBackend):
+    """
+    tabula-java running in one in-process JVM (jpype) for the life of the
+    process: batches leave it running, it is shut down at interpreter exit
+    (or by an explicit close() / context exit)
+    tabula-java is called through the backend's own TabulaVm rather than
+    tabula.read_pdf, whose shared vm falls back to a subprocess silently
+    note: jpype cannot restart a JVM once it has been shut down
+    """
+
+    name = "jvm"
+    java_options = ["-Dfile.encoding=UTF8"]  # as tabula.read_pdf passes them
+
+    def __init__(self) -> None:
+        super().__init__()
+        try:
+            import jpype
+        except ImportError as e:
+            raise BackendUnavailable(f"{self.name} backend requires jpype1: {e=}")
+        if _jvm_shut_down:
+            raise BackendUnavailable("JVM was already shut down in this process")
+        try:
+            self._vm = TabulaVm(java_options=list(self.java_options), silent=True)
+        except Exception as e:  # no JVM found, bad options, ...
+            raise BackendUnavailable(f"{self.name} backend: JVM failed to start: {e!r}")
+        if self._vm.tabula is None or not jpype.isJVMStarted():
+            # TabulaVm only logs this, read_pdf would carry on in a subprocess
+            raise BackendUnavailable(
+                f"{self.name} backend: tabula-java did not load in the JVM"
+            )
+        self._jpype = jpype
+        self.closed = False
+        atexit.register(self.close)
+        lg.info("tabula JVM started")
+
+    def json_tables(self, filepath, area: list) -> list[dict]:
+        if self.closed:
+            raise BackendUnavailable("JVM was already shut down in this process")
+        options = TabulaOption(
+            pages=[1],
+            area=area,
+            relative_area=True,
+            stream=True,  # one table per area, see TabulaBackend.json_tables
+            format="JSON",
+            silent=True,
+        )
+        # a path as it is, a pdf in memory goes through a temporary file
+        path, temporary = localize_file(filepath)
+        try:
+            output = self._vm.call_tabula_java(options, path)
+        finally:
+            if temporary:
+                os.unlink(path)
+        return json.loads(output) if output else []
+
+    def close(self) -> None:
+        global _jvm_shut_down
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        if self._jpype.isJVMStarted():
+            self._jpype.shutdownJVM()
+            _jvm_shut_down = True
+            lg.info("tabula JVM shut down")
+        _backends.pop(self.name, None)
+
+
+def _matrix_multiply(m: list[float], n: list[float]) -> list[float]:
+    return [
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    ]
+
+
+class TextFragment:
+    __slots__ = ("x", "y", "size", "text")
+
+    def __init__(self, x: float, y: float, size: float, text: str) -> None:
+        self.x = x
+        self.y = y
+        self.size = size
+        self.text = text
+
+    @property
+    def width(self) -> float:
+        # no font metrics from pypdf, ~0.55 em per glyph fits Helvetica/Arial
+        return 0.55 * self.size * len(self.text)
+
+    @property
+    def right(self) -> float:
+        return self.x + self.width
+
+
+class TextLayoutBackend(TabulaBackend):
+    """
+    pure python alternative to tabula (no JVM), built on pypdf positioned text
+    areas are cut from page 1 and rebuilt into rows and columns:
+    rows group fragments on the same baseline, columns are the merged
+    horizontal extents of cells across all rows (like tabula stream mode)
+    """
+
+    name = "text"
+    needs_reader = True
+
+    def __init__(self) -> None:
+        pass
+
+    def get_fragments(self, reader: PdfReader) -> tuple[list[TextFragment], list]:
+        page = reader.pages[0]
+        fragments = []
+
+        def visitor(text, cm, tm, font_dict, font_size):
+            text = text.strip()
+            if not text:
+                return
+            m = _matrix_multiply(tm, cm)
+            size = font_size * (abs(m[3]) if m[3] else 1.0)
+            fragments.append(TextFragment(m[4], m[5], size, text))
+
+        page.extract_text(visitor_text=visitor)
+        return fragments, [float(x) for x in page.mediabox]
+
+    @staticmethod
+    def build_table(fragments: list[TextFragment]) -> dict:
+        """
+        returns a tabula-java style json table {"data": [[{"text": ...}]]}
+        """
+        rows: list[list[TextFragment]] = []
+        for frag in sorted(fragments, key=lambda f: (-f.y, f.x)):
+            if rows and abs(rows[-1][0].y - frag.y) <= 0.5 * frag.size:
+                rows[-1].append(frag)
+            else:
+                rows.append([frag])
+
+        cells: list[list[TextFragment]] = []
+        for row in rows:
+            row.sort(key=lambda f: f.x)
+            merged = [row[0]]
+            for frag in row[1:]:
+                prev = merged[-1]
+                if frag.x - prev.right < frag.size:
+                    merged[-1] = TextFragment(
+                        prev.x, prev.y, prev.size, f"{prev.text} {frag.text}"
+                    )
+                else:
+                    merged.append(frag)
+            cells.append(merged)
+
+        columns: list[list[float]] = []
+        for x0, x1 in sorted((c.x, c.right) for row in cells for c in row):
+            if columns and x0 <= columns[-1][1]:
+                columns[-1][1] = max(columns[-1][1], x1)
+            else:
+                columns.append([x0, x1])
+
+        data = []
+        for row in cells:
+            texts = [""] * len(columns)
+            for cell in row:
+                i = max(i for i, col in enumerate(columns) if col[0] <= cell.x)
+                texts[i] = f"{texts[i]} {cell.text}".strip()
+            data.append([{"text": t} for t in texts])
+        return {"data": data}
+
+    @staticmethod
+    def crop(
+        fragments: list[TextFragment], mediabox: list, area: list[float]
+    ) -> list[TextFragment]:
+        """
+        area is tabula's relative [top, left, bottom, right] in % of the page
+        """
+        x0, y0, x1, y1 = mediabox
+        width, height = x1 - x0, y1 - y0
+        top, left, bottom, right = area
+        y_top = y1 - top / 100 * height
+        y_bottom = y1 - bottom / 100 * height
+        x_left = x0 + left / 100 * width
+        x_right = x0 + right / 100 * width
+        return [
+            f
+            for f in fragments
+            if x_left <= f.x <= x_right and y_bottom <= f.y <= y_top
+        ]
+
+    def read_area(
+        self,
+        reader: PdfReader,
+        area: list[float],
+        header: Optional[int] = None,
+    ) -> pd.DataFrame:
+        tables = self.extract(reader, {"area": area}, {"area": header})
+        return tables["area"]
+
+    def extract(
+        self,
+        reader: PdfReader,
+        areas: dict[str, list[float]],
+        headers: Optional[dict[str, int]] = None,
+    ) -> dict[str, pd.DataFrame]:
+        """
+        reader is an open (already decrypted) PdfReader, or a path to open
+        """
+        headers = headers if headers else {}
+        if not isinstance(reader, PdfReader):
+            reader, _ = decrypt.open_pdf(reader)
+        with instrument.stage("text_layout"):
+            fragments, mediabox = self.get_fragments(reader)
+        tables = {}
+        for name, area in areas.items():
+            with instrument.stage(f"area:{name}"):
+                tables[name] = table_to_dataframe(
+                    self.build_table(self.crop(fragments, mediabox, area)),
+                    header=headers.get(name),
+                )
+        return tables
+
+
+def parity_report(
+    filepaths: Iterable[Path],
+    areas: dict[str, list[float]],
+    headers: Optional[dict[str, int]] = None,
+    reference: str = "subprocess",
+    candidate: str = "text",
+) -> pd.DataFrame:
+    """
+    compare the tables of two backends area by area
+    returns one row per (file, area) with shapes and whether values match
+    """
+    ref_backend = get_backend(reference)
+    cand_backend = get_backend(candidate)
+    records = []
+    for fp in filepaths:
+        results = {}
+        reader, _ = decrypt.open_pdf(fp)
+        plain = decrypt.decrypted_copy(reader) if reader.is_encrypted else None
+        for backend in (ref_backend, cand_backend):
+            if backend.needs_reader:
+                source = reader
+            else:
+                source = io.BytesIO(plain) if plain is not None else fp
+            results[backend.name] = backend.extract(source, areas, headers)
+        for name in areas:
+            ref = results[ref_backend.name][name]
+            cand = results[cand_backend.name][name]
+            same = (
+                ref.shape == cand.shape
+                and (ref.astype(str).values == cand.astype(str).values).all()
+            )
+            records.append(
+                {
+                    "file": fp.name,
+                    "area": name,
+                    f"{reference}_shape": ref.shape,
+                    f"{candidate}_shape": cand.shape,
+                    "match": bool(same),
+                }
+            )
+    df = pd.DataFrame(records)
+    if not df.empty:
+        lg.info(
+            "parity %s vs %s: %.1f%% match",
+            candidate,
+            reference,
+            100 * df["match"].mean(),
+        )
+    return df
+
+
+BACKENDS = {
+    TabulaBackend.name: TabulaBackend,
+    PersistentTabulaBackend.name: PersistentTabulaBackend,
+    TextLayoutBackend.name: TextLayoutBackend,
+}
+DEFAULT_BACKEND = TabulaBackend.name
+
+_backends: dict[str, TabulaBackend] = {}
+
+
+def get_backend(name: str = "") -> TabulaBackend:
+    """
+    returns the shared backend instance by name (default: subprocess tabula)
+    """
+    name = name if name else DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"unknown backend {name=}, choose from {list(BACKENDS)}")
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+def close_all() -> None:
+    for backend in list(_backends.values()):
+        backend.close()
@@ -0,0 +1,329 @@
+import logging
+import os
+import subprocess
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from multiprocessing.util import Finalize
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import pandas as pd
+
+import utils
+import backends
+import instrument
+from cache import PayslipCache, bytes_hash, file_hash, layout_hash
+from pdfobject import PdfObject
+from records import PayslipRecord, RecordAccumulator
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+_worker_backend_name = ""
+
+
+@dataclass
+class BatchResult:
+    data: pd.DataFrame
+    parsed: list[Path] = field(default_factory=list)
+    failures: list[tuple[Path, str]] = field(default_factory=list)
+    stats: list[instrument.FileStats] = field(default_factory=list)
+
+
+@dataclass
+class ParseOutcome:
+    filepath: Path
+    row: Optional[PayslipRecord] = None
+    tables: Optional[dict[str, pd.DataFrame]] = None
+    error: str = ""
+    error_type: str = ""  # exception class name, e.g. "KeyError"
+    cached: bool = False
+    stats: Optional[instrument.FileStats] = None
+    payslip_cls: Optional[type] = None  # the layout it was parsed with
+
+
+def init_worker(
+    backend_name: str,
+    log_queue=None,
+    log_level: int = logging.INFO,
+) -> None:
+    """
+    backends are created per worker process and closed when the pool shuts down
+    worker log records at log_level go through log_queue to the parent's handlers
+    """
+    global _worker_backend_name
+    _worker_backend_name = backend_name
+    utils.init_worker_logging(log_queue, log_level)
+    Finalize(None, backends.close_all, exitpriority=10)
+
+
+def redact(e: BaseException) -> BaseException:
+    """
+    drop the command line of a failed subprocess (tabula-java) from e and the
+    exceptions chained to it, before the error is logged, stored or returned
+    """
+    seen = set()
+    cur: Optional[BaseException] = e
+    while cur is not None and id(cur) not in seen:
+        seen.add(id(cur))
+        if isinstance(cur, (subprocess.CalledProcessError, subprocess.TimeoutExpired)):
+            cmd = cur.cmd
+            cur.cmd = Path(cmd[0]).name if isinstance(cmd, (list, tuple)) else "<cmd>"
+            cur.args = tuple(cur.cmd if arg is cmd else arg for arg in cur.args)
+        cur = cur.__cause__ or cur.__context__
+    return e
+
+
+def split_source(item) -> tuple[Path, Optional[bytes]]:
+    """
+    a payslip to parse is a path, or a (name, data) pair such as archives.Member
+    """
+    if isinstance(item, tuple):
+        return Path(item[0]), item[1]
+    return item, None
+
+
+def source_hash(filepath: Path, data: Optional[bytes] = None) -> str:
+    return bytes_hash(data) if data is not None else file_hash(filepath)
+
+
+def cached_layout(
+    layouts: list[type], cache: Optional[PayslipCache], content_hash: str
+) -> Optional[type]:
+    """
+    the layout a file was classified as earlier, None if not in cache
+    """
+    if cache is None or not content_hash:
+        return None
+    name = cache.get_layout(content_hash)
+    return next((cls for cls in layouts if cls.__name__ == name), None)
+
+
+def detect_layout(
+    source: Union[Path, PdfObject],
+    layouts: list[type],
+    cache: Optional[PayslipCache] = None,
+    content_hash: str = "",
+    data: Optional[bytes] = None,
+) -> Optional[type]:
+    """
+    pick the layout whose text markers best match page 1, None if none match
+    given the PdfObject that is parsed next, its page 1 text is read (and the
+    file decrypted) once for both
+    the result is remembered in cache so a file is classified only once
+    """
+    cls = cached_layout(layouts, cache, content_hash)
+    if cls is not None:
+        return cls
+    if isinstance(source, PdfObject):
+        pdf = source
+    else:
+        pdf = PdfObject(data if data is not None else source, name=str(source))
+    text = pdf.page_text(0)
+    with instrument.stage("detect"):
+        score, best = max(
+            ((cls.match_layout(text), cls) for cls in layouts), key=lambda x: x[0]
+        )
+    if not score:
+        return None
+    if cache is not None and content_hash:
+        cache.put_layout(content_hash, best.__name__)
+    return best
+
+
+def open_payslip(
+    payslip_cls: Union[type, list[type]],
+    filepath: Path,
+    backend_name: str = "",
+    data: Optional[bytes] = None,
+):
+    """
+    the payslip object to parse, None if no layout matches
+    given a list of layouts, the file is classified from that object's own
+    reader, so an encrypted pdf is decrypted once
+    """
+    source = data if data is not None else filepath
+    if isinstance(payslip_cls, list):
+        pdf = PdfObject(source, name=str(filepath))
+        cls = detect_layout(pdf, payslip_cls)
+        if cls is None:
+            return None
+        source = pdf
+    else:
+        cls = payslip_cls
+    name = backend_name or _worker_backend_name or cls.backend_name
+    return cls(source, backend=backends.get_backend(name), name=str(filepath))
+
+
+def parse_one(
+    payslip_cls: Union[type, list[type]],
+    filepath: Path,
+    backend_name: str = "",
+    data: Optional[bytes] = None,
+) -> ParseOutcome:
+    """
+    parse and crunch a single payslip, exceptions are returned in .error
+    payslip_cls is a layout, or a list of layouts to detect it from
+    with data, filepath only names the in-memory pdf
+    stage timings and counters come back in .stats (also from worker processes)
+    """
+    with instrument.timed_file(filepath) as stats:
+        try:
+            ps = open_payslip(payslip_cls, filepath, backend_name, data)
+            if ps is None:
+                return ParseOutcome(
+                    filepath,
+                    error="unknown payslip layout",
+                    error_type="UnknownLayout",
+                    stats=stats,
+                )
+            ps.get_layout_tables()
+            with instrument.stage("parse"):
+                ps.parse()
+            with instrument.stage("crunch"):
+                row = ps.crunch()
+        except Exception as e:
+            error = f"{redact(e)!r}\n{traceback.format_exc()}"
+            return ParseOutcome(
+                filepath, error=error, error_type=type(e).__name__, stats=stats
+            )
+    return ParseOutcome(
+        filepath, row=row, tables=ps.tables, stats=stats, payslip_cls=type(ps)
+    )
+
+
+def merge_results(rows: list[tuple[Path, PayslipRecord]]) -> pd.DataFrame:
+    """
+    one frame of per-payslip rows ordered by pay date, ties broken by file path
+    """
+    acc = RecordAccumulator(capacity=max(1, len(rows)))
+    for filepath, row in sorted(rows, key=lambda x: (x[1].date, x[0])):
+        acc.append(row, source=str(filepath))
+    df = acc.to_frame()
+    if "source" not in df:
+        # no rows: keep the column so outputs can be merged by source later
+        df.insert(0, "source", pd.Series([], dtype=object, index=df.index))
+    return df
+
+
+def run_batch(
+    filepaths: Iterable[Union[Path, tuple[Path, bytes]]],
+    payslip_cls: Union[type, list[type]],
+    workers: int = 1,
+    backend_name: str = "",
+    cache: Optional[PayslipCache] = None,
+    worker_log_level: int = logging.INFO,
+) -> BatchResult:
+    """
+    parse payslips with payslip_cls (FlexHRPayslip or SAPPayslip)
+    or, given a list of layouts, with whichever layout detect_layout() picks
+    backend_name defaults to each layout's own payslip_cls.backend_name
+    workers=1 runs the sequential loop in this process, workers<=0 uses all cpus
+    files already in cache are not parsed again, new results are added to it
+    a failing file is logged and reported in BatchResult.failures
+    (name, data) pairs, e.g. archive members, are parsed from memory
+    """
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    layouts = payslip_cls if isinstance(payslip_cls, list) else None
+
+    outcomes = []
+    hits = 0
+    pending: list[tuple[Union[type, list[type]], Path, Optional[bytes]]] = []
+    hashes: dict[Path, str] = {}
+    pre_stats: dict[Path, instrument.FileStats] = {}
+    for item in filepaths:
+        fp, data = split_source(item)
+        cls = payslip_cls
+        with instrument.timed_file(fp) as pre_stats[fp]:
+            content_hash = ""
+            if cache is not None:
+                try:
+                    with instrument.stage("hash"):
+                        content_hash = source_hash(fp, data)
+                except Exception as e:
+                    error = f"{redact(e)!r}\n{traceback.format_exc()}"
+                    outcomes.append(
+                        ParseOutcome(fp, error=error, error_type=type(e).__name__)
+                    )
+                    continue
+            if layouts is not None:
+                # not seen before: detected where it is parsed, from the
+                # same (decrypted) pdf
+                cls = cached_layout(layouts, cache, content_hash) or layouts
+        hashes[fp] = content_hash
+        if cache is not None and not isinstance(cls, list):
+            entry = cache.get(
+                content_hash, layout_hash(cls, backend_name or cls.backend_name)
+            )
+            if entry is not None and entry.row is not None:
+                outcomes.append(
+                    ParseOutcome(fp, row=entry.row, tables=entry.tables, cached=True)
+                )
+                hits += 1
+                continue
+        elif cache is not None:
+            cache.misses += 1  # never classified, so never parsed either
+        pending.append((cls, fp, data))
+    if cache is not None:
+        lg.info("cache: %d hits, %d to parse", hits, len(pending))
+
+    if workers == 1 or len(pending) <= 1:
+        # in-process backends stay open for later batches, jpype cannot
+        # restart a JVM; PersistentTabulaBackend closes itself at exit
+        outcomes += [
+            parse_one(cls, fp, backend_name, data) for cls, fp, data in pending
+        ]
+    else:
+        with utils.worker_log_queue() as log_queue, ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(backend_name, log_queue, worker_log_level),
+        ) as pool:
+            outcomes += pool.map(
+                parse_one,
+                [x[0] for x in pending],
+                [x[1] for x in pending],
+                [""] * len(pending),
+                [x[2] for x in pending],
+                chunksize=max(1, len(pending) // (4 * workers)),
+            )
+    rows = []
+    result = BatchResult(data=pd.DataFrame())
+    for outcome in outcomes:
+        stats = pre_stats.get(outcome.filepath)
+        if stats is None:
+            stats = instrument.FileStats(str(outcome.filepath))
+        stats.merge(outcome.stats)
+        result.stats.append(stats)
+        if outcome.row is None:
+            lg.warning(
+                "failed to parse %s: %s",
+                outcome.filepath.name,
+                outcome.error.splitlines()[0],
+            )
+            result.failures.append((outcome.filepath, outcome.error))
+            continue
+        rows.append((outcome.filepath, outcome.row))
+        result.parsed.append(outcome.filepath)
+        if cache is not None and not outcome.cached:
+            cls, content_hash = outcome.payslip_cls, hashes[outcome.filepath]
+            cache.put_layout(content_hash, cls.__name__)
+            cache.put(
+                content_hash,
+                layout_hash(cls, backend_name or cls.backend_name),
+                outcome.tables,
+                outcome.row,
+            )
+    if cache is not None:
+        cache.commit()
+    result.data = merge_results(rows)
+    lg.info(
+        "batch done: %d parsed, %d failed, workers=%d",
+        len(result.parsed),
+        len(result.failures),
+        workers,
+    )
+    return result
@@ -0,0 +1,270 @@
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import amounts
+import backends
+import batch
+import export
+import mapping
+import synth
+from main import LAYOUTS
+from pdfobject import PdfObject
+
+RESULTS_FILENAME = "bench_results.jsonl"
+SIZES = (10, 1_000, 10_000)
+CLI = Path(__file__).parent.parent / "cli.py"
+# what a user waits for before anything happens; the cli must stay fast to start
+STARTUP_COMMANDS = {
+    "cli --help": [str(CLI), "--help"],
+    "import discovery": ["-c", "import discovery"],
+    "import main": ["-c", "import main"],
+}
+
+
+def per_cell_amounts(values: pd.Series) -> list[Decimal]:
+    """
+    the previous per-cell path: strip signs and commas, then Decimal(str(x))
+    """
+    return [
+        Decimal(str(x).strip("+").strip("-").replace(",", ""))
+        for x in values.apply(lambda x: x.strip("+").strip("-").replace(",", ""))
+    ]
+
+
+def vectorized_amounts(values: pd.Series) -> pd.Series:
+    return amounts.parse_amounts(values).abs()
+
+
+def timeit(func, *args, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_amounts(n: int = 100_000, repeat: int = 5) -> pd.DataFrame:
+    """
+    micro-benchmark of amount normalization, best of `repeat` runs
+    """
+    samples = ["3,000.00", "+45.00", "-1,020.50", "12.5", "1,234,567.89"]
+    values = pd.Series((samples * (n // len(samples) + 1))[:n])
+    assert [amounts.cents_to_decimal(x) for x in vectorized_amounts(values)] == (
+        per_cell_amounts(values)
+    )
+    res = pd.DataFrame(
+        [
+            {
+                "path": "per_cell",
+                "seconds": timeit(per_cell_amounts, values, repeat=repeat),
+            },
+            {
+                "path": "vectorized",
+                "seconds": timeit(vectorized_amounts, values, repeat=repeat),
+            },
+        ]
+    )
+    res["cells_per_sec"] = n / res["seconds"]
+    return res
+
+
+def bench_tables(repeat: int = 200) -> pd.DataFrame:
+    """
+    label mapping of one table the size actually parsed (about 10 rows:
+    mapped labels, a blank and an unknown label), mean ms per call
+    """
+    rows = []
+    for layout, table in (
+        mapping.get_mappings()[["layout", "table"]]
+        .drop_duplicates()
+        .itertuples(index=False)
+    ):
+        labels = list(mapping.get_mapping(layout, table).fields)[:8]
+        descr = pd.Series(labels + [None, "UNKNOWN LABEL"], dtype=object)
+        amt = pd.Series(["1,234.50"] * len(labels) + ["", "12.00"], dtype=object)
+        seconds = timeit(
+            lambda: [
+                mapping.apply_mapping(descr, amt, mapping.get_mapping(layout, table))
+                for _ in range(repeat)
+            ],
+            repeat=3,
+        )
+        rows.append(
+            {
+                "layout": layout,
+                "table": table,
+                "rows": len(descr),
+                "ms_per_table": round(1000 * seconds / repeat, 3),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def _bench_size(n: int, backend_name: str = "text", seed: int = 0) -> dict:
+    """
+    generate n synthetic payslips, then time every stage of every file
+    open (reader) -> detect (layout markers, on the same reader) -> extract
+    (areas) -> crunch (mapping + math), then merge + export of the whole batch
+    """
+    backend = backends.get_backend(backend_name)
+    timings: dict[str, list[float]] = {
+        "open": [],
+        "detect": [],
+        "extract": [],
+        "crunch": [],
+    }
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        filepaths = synth.generate(Path(tmp), n, seed=seed)
+        rows = []
+        t_start = time.perf_counter()
+        for fp in filepaths:
+            t0 = time.perf_counter()
+            try:
+                pdf = PdfObject(fp)
+                pdf.reader
+                t1 = time.perf_counter()
+                cls = batch.detect_layout(pdf, LAYOUTS)
+                t2 = time.perf_counter()
+                ps = cls(pdf, backend=backend)
+                ps.get_layout_tables()
+                t3 = time.perf_counter()
+                rows.append((fp, ps.parse().crunch()))
+                t4 = time.perf_counter()
+            except Exception:
+                failures += 1
+                continue
+            for stage, seconds in zip(timings, (t1 - t0, t2 - t1, t3 - t2, t4 - t3)):
+                timings[stage].append(seconds)
+        t0 = time.perf_counter()
+        export.to_parquet(batch.merge_results(rows), Path(tmp) / "output.parquet")
+        export_seconds = time.perf_counter() - t0
+        total = time.perf_counter() - t_start
+    backends.close_all()
+    res = {
+        "files": n,
+        "failures": failures,
+        "seconds": round(total, 3),
+        "files_per_sec": round(n / total, 1),
+        "export_ms": round(1000 * export_seconds, 2),
+        # ru_maxrss is in KiB on linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+    for stage, values in timings.items():
+        ms = 1000 * np.array(values if values else [np.nan])
+        res[f"{stage}_p50_ms"] = round(float(np.median(ms)), 3)
+        res[f"{stage}_p95_ms"] = round(float(np.percentile(ms, 95)), 3)
+    return res
+
+
+def bench_pipeline(
+    sizes: tuple[int, ...] = SIZES,
+    backend_name: str = "text",
+    seed: int = 0,
+    results: Path = Path(RESULTS_FILENAME),
+) -> pd.DataFrame:
+    """
+    per-stage latency, files/sec and peak RSS on synthetic FlexHR/SAP payslips
+    each size runs in a fresh process so peak RSS is its own
+    every row is appended to results (json lines) to compare runs over time
+    """
+    run = {
+        "run_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "benchmark": "pipeline",
+        "backend": backend_name,
+    }
+    rows = []
+    for n in sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as ex:
+            rows.append(
+                {**run, **ex.submit(_bench_size, n, backend_name, seed).result()}
+            )
+        _append_results(rows[-1:], results)
+    return pd.DataFrame(rows)
+
+
+def _append_results(rows: list[dict], results: Path) -> None:
+    with open(results, "a") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+def bench_imports(
+    repeat: int = 5, results: Path = Path(RESULTS_FILENAME)
+) -> pd.DataFrame:
+    """
+    wall time to start a fresh interpreter and run each of STARTUP_COMMANDS,
+    best of `repeat`; run from an empty directory so nothing (e.g. a log file)
+    is written next to the results
+    """
+    run = {
+        "run_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "benchmark": "imports",
+    }
+    env = {**os.environ, "PYTHONPATH": str(Path(__file__).parent)}
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, args in STARTUP_COMMANDS.items():
+            best = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                subprocess.run(
+                    [sys.executable, *args],
+                    cwd=tmp,
+                    env=env,
+                    check=True,
+                    capture_output=True,
+                )
+                best = min(best, time.perf_counter() - t0)
+            rows.append({**run, "command": name, "startup_ms": round(1000 * best, 1)})
+    _append_results(rows, results)
+    return pd.DataFrame(rows)
+
+
+def load_results(results: Path = Path(RESULTS_FILENAME)) -> pd.DataFrame:
+    """
+    every stored benchmark row, to compare runs (revision) of the same
+    benchmark at the same size or command
+    """
+    return pd.read_json(results, lines=True)
+
+
+if __name__ == "__main__":
+    print(bench_imports())
+    print(bench_amounts())
+    print(bench_tables())
+    sizes = tuple(int(x) for x in sys.argv[1:]) or SIZES
+    print(bench_pipeline(sizes).T)
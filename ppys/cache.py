@@ -0,0 +1,226 @@
+import hashlib
+import json
+import pickle
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+import utils
+import mapping
+from records import PayslipRecord
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+CACHE_FILENAME = ".ppys_cache.sqlite"
+CACHE_VERSION = 3  # bump when the stored tables or rows change format
+
+
+def file_hash(filepath: Path) -> str:
+    h = hashlib.sha256()
+    with open(filepath, "rb") as reader:
+        for chunk in iter(lambda: reader.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def bytes_hash(data: bytes) -> str:
+    """
+    same digest as file_hash, for a pdf already in memory
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def layout_hash(payslip_cls: type, backend_name: str = "") -> str:
+    """
+    fingerprint of everything that decides what gets extracted from a file
+    """
+    spec = {
+        "version": CACHE_VERSION,
+        "layout": payslip_cls.__name__,
+        "backend": backend_name,
+        "areas": payslip_cls.areas,
+        "headers": payslip_cls.table_headers,
+        "mappings": mapping.mappings_hash(payslip_cls.layout),
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def row_to_json(row: PayslipRecord) -> str:
+    return json.dumps(row.to_dict())
+
+
+def row_from_json(text: str) -> PayslipRecord:
+    return PayslipRecord.from_dict(json.loads(text))
+
+
+@dataclass
+class CacheEntry:
+    tables: dict[str, pd.DataFrame]
+    row: Optional[PayslipRecord]
+
+
+class PayslipCache:
+    """
+    sqlite cache of extracted tables and crunched rows
+    keyed by file content hash + layout fingerprint (backend, areas, mappings)
+    evict() drops entries unused for max_age_days and keeps at most max_entries,
+    and the layouts of files no longer cached, when the cache is closed
+    read_only opens an existing cache to look at, e.g. counts(), as it is
+    """
+
+    def __init__(
+        self,
+        filepath: Path,
+        max_entries: int = 0,
+        max_age_days: float = 0,
+        read_only: bool = False,
+    ) -> None:
+        self.filepath = filepath
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        if read_only:
+            uri = f"{Path(filepath).resolve().as_uri()}?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True)
+            return
+        self.conn = sqlite3.connect(filepath)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS payslips (
+                content_hash TEXT NOT NULL,
+                layout_hash TEXT NOT NULL,
+                tables BLOB NOT NULL,
+                row TEXT,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (content_hash, layout_hash)
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS layouts (
+                content_hash TEXT PRIMARY KEY,
+                layout TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if not self.read_only:
+            self.evict()
+        self.conn.close()
+        lg.info("cache closed hits=%d misses=%d", self.hits, self.misses)
+
+    def counts(self) -> dict[str, int]:
+        """
+        number of classified files, and of cached payslips per layout fingerprint
+        """
+        res = {
+            "layouts": self.conn.execute("SELECT COUNT(*) FROM layouts").fetchone()[0]
+        }
+        for layout, n in self.conn.execute(
+            "SELECT layout_hash, COUNT(*) FROM payslips GROUP BY layout_hash"
+        ):
+            res[f"payslips {layout[:12]}"] = n
+        return res
+
+    def get(self, content_hash: str, layout: str) -> Optional[CacheEntry]:
+        res = self.conn.execute(
+            "SELECT tables, row FROM payslips WHERE content_hash=? AND layout_hash=?",
+            (content_hash, layout),
+        ).fetchone()
+        if res is None:
+            self.misses += 1
+            return None
+        try:
+            entry = CacheEntry(
+                tables=pickle.loads(res[0]),
+                row=row_from_json(res[1]) if res[1] else None,
+            )
+        except Exception as e:
+            # written by another pandas or PayslipRecord version: parse again
+            lg.warning("dropping unreadable cache entry %s: %r", content_hash[:12], e)
+            self.conn.execute(
+                "DELETE FROM payslips WHERE content_hash=? AND layout_hash=?",
+                (content_hash, layout),
+            )
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute(
+            "UPDATE payslips SET last_used=? WHERE content_hash=? AND layout_hash=?",
+            (time.time(), content_hash, layout),
+        )
+        return entry
+
+    def put(
+        self,
+        content_hash: str,
+        layout: str,
+        tables: dict[str, pd.DataFrame],
+        row: Optional[PayslipRecord] = None,
+    ) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO payslips VALUES (?, ?, ?, ?, ?)",
+            (
+                content_hash,
+                layout,
+                pickle.dumps(tables),
+                row_to_json(row) if row is not None else None,
+                time.time(),
+            ),
+        )
+
+    def get_layout(self, content_hash: str) -> str:
+        res = self.conn.execute(
+            "SELECT layout FROM layouts WHERE content_hash=?", (content_hash,)
+        ).fetchone()
+        return res[0] if res else ""
+
+    def put_layout(self, content_hash: str, layout: str) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO layouts VALUES (?, ?)", (content_hash, layout)
+        )
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def evict(self) -> int:
+        n = self.conn.total_changes
+        if self.max_age_days:
+            cutoff = time.time() - self.max_age_days * 86400
+            self.conn.execute("DELETE FROM payslips WHERE last_used < ?", (cutoff,))
+        if self.max_entries:
+            self.conn.execute(
+                """
+                DELETE FROM payslips WHERE rowid NOT IN (
+                    SELECT rowid FROM payslips ORDER BY last_used DESC LIMIT ?
+                )
+                """,
+                (self.max_entries,),
+            )
+        # a classification is only worth keeping next to a cached payslip
+        self.conn.execute(
+            "DELETE FROM layouts WHERE content_hash NOT IN "
+            "(SELECT content_hash FROM payslips)"
+        )
+        self.conn.commit()
+        evicted = self.conn.total_changes - n
+        if evicted:
+            lg.info("cache evicted %d entries", evicted)
+        return evicted
@@ -0,0 +1,76 @@
+import io
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from pypdf import PasswordType, PdfReader, PdfWriter
+
+import utils
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+PASSWORD_ENV = "PASSWORD"
+PASSWORD_FILE_ENV = "PASSWORD_FILE"  # one password per line
+
+_last_password: Optional[str] = None
+
+
+class WrongPassword(Exception):
+    pass
+
+
+@lru_cache(maxsize=1)
+def get_passwords() -> tuple[str, ...]:
+    """
+    PASSWORD, then every line of the PASSWORD_FILE, from the environment (.env)
+    read once per process, call get_passwords.cache_clear() after changing them
+    """
+    passwords = []
+    if os.getenv(PASSWORD_ENV):
+        passwords.append(os.environ[PASSWORD_ENV])
+    if os.getenv(PASSWORD_FILE_ENV):
+        lines = Path(os.environ[PASSWORD_FILE_ENV]).read_text().splitlines()
+        passwords += [x for x in lines if x and x not in passwords]
+    return tuple(passwords)
+
+
+def open_pdf(
+    source, passwords: Optional[tuple[str, ...]] = None, name: str = ""
+) -> tuple[PdfReader, str]:
+    """
+    PdfReader over source (path or file object), decrypted if it is encrypted
+    returns (reader, the password that worked, "" if none was needed)
+    name is the file named by WrongPassword, default the path of source
+    the password that opened the previous file is tried first, as a batch
+    usually shares one
+    """
+    global _last_password
+    reader = PdfReader(source)
+    if not reader.is_encrypted:
+        return reader, ""
+    passwords = get_passwords() if passwords is None else passwords
+    candidates = [""] + list(passwords)
+    if _last_password in candidates:
+        candidates.remove(_last_password)
+        candidates.insert(0, _last_password)
+    for password in candidates:
+        if reader.decrypt(password) != PasswordType.NOT_DECRYPTED:
+            _last_password = password
+            return reader, password
+    if not name:
+        name = str(source) if isinstance(source, (str, Path)) else "<memory>.pdf"
+    raise WrongPassword(f"none of {len(passwords)} passwords opens {name}")
+
+
+def decrypted_copy(reader: PdfReader) -> bytes:
+    """
+    the pdf of an opened (decrypted) reader rewritten without encryption, for
+    tools like tabula-java that would otherwise need the password on their
+    command line
+    """
+    out = io.BytesIO()
+    PdfWriter(clone_from=reader).write(out)
+    return out.getvalue()
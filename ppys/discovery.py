@@ -0,0 +1,94 @@
+import os
+import time
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+import utils
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+DEFAULT_INCLUDE = ("*.[pP][dD][fF]",)
+
+
+@dataclass
+class DiscoveryStats:
+    dirs: int = 0
+    files: int = 0
+    matched: int = 0
+    errors: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        """
+        entries looked at per second
+        """
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.matched} payslips out of {self.files} files in {self.dirs} dirs, "
+            f"{self.elapsed:.2f}s ({self.rate:,.0f} files/s), {self.errors} errors"
+        )
+
+
+def _matches(relpath: str, patterns: Iterable[str]) -> bool:
+    return any(fnmatchcase(relpath, p) for p in patterns)
+
+
+def walk_payslips(
+    roots: Iterable[Union[str, Path]],
+    include: Iterable[str] = DEFAULT_INCLUDE,
+    exclude: Iterable[str] = (),
+    recursive: bool = True,
+    stats: Optional[DiscoveryStats] = None,
+    report_every: int = 10_000,
+) -> Iterator[Path]:
+    """
+    yield payslip paths under roots as they are found (os.scandir, depth first)
+    globs are matched against the path relative to its root, e.g. "2022/*/*.pdf",
+    and "*" also matches across "/"; an excluded directory is not descended into
+    entries are sorted per directory so the order is stable between runs
+    pass a DiscoveryStats to read the counters while or after walking
+    """
+    include, exclude = tuple(include), tuple(exclude)
+    stats = stats if stats is not None else DiscoveryStats()
+    for root in map(Path, roots):
+        stack = [(root, "")]
+        while stack:
+            dirpath, reldir = stack.pop()
+            try:
+                with os.scandir(dirpath) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                stats.errors += 1
+                lg.warning("cannot scan %s: %s", dirpath, e)
+                continue
+            stats.dirs += 1
+            subdirs = []
+            for entry in entries:
+                relpath = f"{reldir}{entry.name}"
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    stats.errors += 1
+                    continue
+                if is_dir:
+                    if recursive and not _matches(relpath, exclude):
+                        subdirs.append((Path(entry.path), relpath + "/"))
+                    continue
+                stats.files += 1
+                if _matches(relpath, include) and not _matches(relpath, exclude):
+                    stats.matched += 1
+                    if stats.matched % report_every == 0:
+                        stats.elapsed = time.perf_counter() - stats.started
+                        lg.info("discovery: %s", stats)
+                    yield Path(entry.path)
+            stack.extend(reversed(subdirs))
+    stats.elapsed = time.perf_counter() - stats.started
+    lg.info("discovery done: %s", stats)
@@ -0,0 +1,104 @@
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+import utils
+import instrument
+import sinks
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+
+def to_parquet(df: pd.DataFrame, filepath: Path) -> None:
+    df.to_parquet(filepath)  # requires pyarrow (or fastparquet)
+
+
+def to_arrow_ipc(df: pd.DataFrame, filepath: Path) -> None:
+    df.reset_index().to_feather(filepath)  # requires pyarrow
+
+
+def to_csv(df: pd.DataFrame, filepath: Path) -> None:
+    df.to_csv(filepath)
+
+
+def to_sqlite(df: pd.DataFrame, filepath: Path, table: str = "payslips") -> None:
+    with closing(sqlite3.connect(filepath)) as conn:
+        df.to_sql(table, conn, if_exists="replace")
+
+
+def to_xlsx(df: pd.DataFrame, filepath: Path) -> None:
+    df.to_excel(filepath)  # requires openpyxl
+
+
+EXPORTERS = {
+    ".parquet": to_parquet,
+    ".arrow": to_arrow_ipc,
+    ".feather": to_arrow_ipc,
+    ".csv": to_csv,
+    ".sqlite": to_sqlite,
+    ".db": to_sqlite,
+    ".xlsx": to_xlsx,
+}
+
+
+def export_frame(df: pd.DataFrame, filepath: Path, xlsx: bool = False) -> list[Path]:
+    """
+    write df in the format given by the suffix of filepath
+    xlsx=True also writes an Excel copy next to it as a final step
+    """
+    try:
+        exporter = EXPORTERS[filepath.suffix.lower()]
+    except KeyError:
+        raise ValueError(
+            f"no exporter for {filepath.name}, choose from {list(EXPORTERS)}"
+        )
+    with instrument.stage("export"):
+        exporter(df, filepath)
+    lg.info("exported %s", filepath.name)
+    exported = [filepath]
+    if xlsx and exporter is not to_xlsx:
+        xlsx_path = filepath.with_suffix(".xlsx")
+        with instrument.stage("export_xlsx"):
+            to_xlsx(df, xlsx_path)
+        lg.info("exported %s", xlsx_path.name)
+        exported.append(xlsx_path)
+    return exported
+
+
+READERS = {
+    ".parquet": pd.read_parquet,
+    ".arrow": lambda fp: pd.read_feather(fp).set_index("date"),
+    ".feather": lambda fp: pd.read_feather(fp).set_index("date"),
+    ".csv": lambda fp: pd.read_csv(fp, index_col="date", parse_dates=["date"]),
+    ".xlsx": lambda fp: pd.read_excel(fp, index_col=0),
+}
+
+
+def read_frame(filepath: Path, table: str = "payslips") -> pd.DataFrame:
+    """
+    read back a frame written by export_frame, or streamed by a sinks.Sink
+    """
+    suffix = filepath.suffix.lower()
+    if suffix in (".sqlite", ".db"):
+        with closing(sqlite3.connect(filepath)) as conn:
+            tables = {
+                x[0]
+                for x in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table'"
+                )
+            }
+            if table not in tables and sinks.SqliteSink.table in tables:
+                return sinks.read_records(conn)
+            return pd.read_sql_query(
+                f"SELECT * FROM {table}", conn, index_col="date", parse_dates=["date"]
+            )
+    try:
+        reader = READERS[suffix]
+    except KeyError:
+        raise ValueError(f"no reader for {filepath.name}, choose from {list(READERS)}")
+    # a streamed csv is in the order the payslips were parsed
+    return reader(filepath).sort_index(kind="stable")
@@ -0,0 +1,285 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pandas as pd
+
+import utils
+from records import FIELDS, PayslipRecord
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+HISTORY_FILENAME = "ppys_history.sqlite"
+# summed per employee and month / year; aws is the 13th month bonus
+ROLLUP_FIELDS = [
+    "accounting_pay",
+    "actual_net_pay",
+    "cpf_employee",
+    "cpf_employer",
+    "bonus_pay",
+    "aws_pay",
+]
+# rollup table: (key column, its type, key of a payslips row)
+PERIODS = {
+    "monthly": ("month", "TEXT", "substr({row}.date, 1, 7)"),
+    "yearly": ("year", "INTEGER", "CAST(substr({row}.date, 1, 4) AS INTEGER)"),
+}
+
+
+def _bound(column: str, value, end: bool = False):
+    """
+    a start or end ("2022", "2022-06", "2022-06-30", a date) in the format of
+    column: the int year, the month "2022-06" or the date "2022-06-30"
+    a coarser bound covers its whole year or month, so end "2022" on dates is
+    "2022-12-31" and start "2022-01-15" on months is "2022-01"
+    """
+    text = str(value)[:10]
+    if column == "year":
+        return int(text[:4])
+    # "2022-06-31" is no date, but compares as the end of june all the same
+    text += ("-12-31" if end else "-01-01")[len(text) - 4 :]
+    return text[:7] if column == "month" else text
+
+
+def _rollup_triggers(table: str, key: str, expr: str) -> str:
+    """
+    keep table in step with every insert and delete on payslips
+    """
+    new, old = expr.format(row="NEW"), expr.format(row="OLD")
+    columns = ", ".join(ROLLUP_FIELDS)
+    added = ", ".join(f"NEW.{f}" for f in ROLLUP_FIELDS)
+    add = ", ".join(f"{f} = {f} + excluded.{f}" for f in ROLLUP_FIELDS)
+    sub = ", ".join(f"{f} = {f} - OLD.{f}" for f in ROLLUP_FIELDS)
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON payslips
+        BEGIN
+            INSERT INTO {table} (employee, {key}, payslips, {columns})
+            VALUES (NEW.employee, {new}, 1, {added})
+            ON CONFLICT (employee, {key}) DO UPDATE
+            SET payslips = payslips + 1, {add};
+        END;
+        CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON payslips
+        BEGIN
+            UPDATE {table} SET payslips = payslips - 1, {sub}
+            WHERE employee = OLD.employee AND {key} = {old};
+            DELETE FROM {table}
+            WHERE employee = OLD.employee AND {key} = {old} AND payslips = 0;
+        END;
+    """
+
+
+class HistoryStore:
+    """
+    sqlite store of every crunched payslip, one row per source file,
+    amounts in int cents, indexed on (employee, date)
+    monthly and yearly totals of ROLLUP_FIELDS are kept up to date by
+    triggers, so YTD or per-year questions read a handful of rows
+    employee is whatever the caller files the payslips under (e.g. the
+    employee folder of an archive), "" for a single person's payslips
+    """
+
+    def __init__(self, filepath: Path) -> None:
+        self.filepath = filepath
+        self.conn = sqlite3.connect(filepath)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f"{f} INTEGER NOT NULL DEFAULT 0" for f in FIELDS)
+        rollups = ", ".join(f"{f} INTEGER NOT NULL DEFAULT 0" for f in ROLLUP_FIELDS)
+        script = f"""
+            CREATE TABLE IF NOT EXISTS payslips (
+                source TEXT PRIMARY KEY,
+                employee TEXT NOT NULL,
+                date TEXT NOT NULL,
+                added_at REAL NOT NULL,
+                {columns}
+            );
+            CREATE INDEX IF NOT EXISTS payslips_employee_date
+            ON payslips (employee, date);
+            CREATE INDEX IF NOT EXISTS payslips_date ON payslips (date);
+        """
+        for table, (key, key_type, expr) in PERIODS.items():
+            script += f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    employee TEXT NOT NULL,
+                    {key} {key_type} NOT NULL,
+                    payslips INTEGER NOT NULL,
+                    {rollups},
+                    PRIMARY KEY (employee, {key})
+                ) WITHOUT ROWID;
+            """
+            script += _rollup_triggers(table, key, expr)
+        self.conn.executescript(script)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def add(self, rows: Iterable[tuple[str, PayslipRecord]], employee: str = "") -> int:
+        """
+        store (source, record) pairs, replacing earlier rows of the same source
+        """
+        now = time.time()
+        data = [
+            (source, employee, row.date.date().isoformat(), now)
+            + tuple(getattr(row, f) for f in FIELDS)
+            for source, row in rows
+        ]
+        placeholders = ", ".join("?" * (4 + len(FIELDS)))
+        with self.conn:
+            # delete + insert rather than REPLACE so the delete triggers fire
+            self.conn.executemany(
+                "DELETE FROM payslips WHERE source = ?", [(x[0],) for x in data]
+            )
+            self.conn.executemany(
+                f"INSERT INTO payslips (source, employee, date, added_at, "
+                f"{', '.join(FIELDS)}) VALUES ({placeholders})",
+                data,
+            )
+        lg.info("history: stored %d payslips", len(data))
+        return len(data)
+
+    def add_frame(
+        self, df: pd.DataFrame, employee: str = "", cents: bool = False
+    ) -> int:
+        """
+        store an output frame (RecordAccumulator.to_frame, export.read_frame)
+        amounts in dollars, or in int cents with cents=True
+        """
+        if df.empty:
+            return 0
+        values = df[FIELDS] if cents else (df[FIELDS] * 100).round()
+        values = values.astype("int64")
+        dates = pd.DatetimeIndex(df.index if "date" not in df else df["date"])
+        sources = df["source"] if "source" in df else pd.Series(dates.astype(str))
+        rows = (
+            (str(source), PayslipRecord(date.to_pydatetime(), *row))
+            for source, date, row in zip(sources, dates, values.itertuples(index=False))
+        )
+        return self.add(rows, employee)
+
+    def remove(self, sources: Iterable[str]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM payslips WHERE source = ?", [(x,) for x in sources]
+            )
+
+    def rebuild_rollups(self) -> None:
+        """
+        recompute the monthly and yearly tables from scratch, e.g. after
+        editing payslips by hand with the triggers dropped
+        """
+        columns = ", ".join(ROLLUP_FIELDS)
+        sums = ", ".join(f"SUM({f})" for f in ROLLUP_FIELDS)
+        with self.conn:
+            for table, (key, _, expr) in PERIODS.items():
+                expr = expr.format(row="payslips")
+                self.conn.execute(f"DELETE FROM {table}")
+                self.conn.execute(
+                    f"INSERT INTO {table} (employee, {key}, payslips, {columns}) "
+                    f"SELECT employee, {expr}, COUNT(*), {sums} "
+                    f"FROM payslips GROUP BY employee, {expr}"
+                )
+
+    def _query(
+        self, sql: str, args: list, index: list[str], cents: bool
+    ) -> pd.DataFrame:
+        df = pd.read_sql_query(sql, self.conn, params=args)
+        if "date" in df:
+            df["date"] = pd.to_datetime(df["date"])
+        amounts = [c for c in df.columns if c in FIELDS]
+        if not cents:
+            df[amounts] = df[amounts] / 100
+        return df.set_index(index)
+
+    def _where(
+        self,
+        column: str,
+        employee: Optional[str],
+        start: Optional[str],
+        end: Optional[str],
+    ) -> tuple[str, list]:
+        clauses, args = [], []
+        if employee is not None:
+            clauses.append("employee = ?")
+            args.append(employee)
+        if start is not None:
+            clauses.append(f"{column} >= ?")
+            args.append(_bound(column, start))
+        if end is not None:
+            clauses.append(f"{column} <= ?")
+            args.append(_bound(column, end, end=True))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), args
+
+    def payslips(
+        self,
+        employee: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        cents: bool = False,
+    ) -> pd.DataFrame:
+        """
+        payslips dated start..end inclusive ("2022-01-01", or a whole "2022-01"
+        or "2022"), of employee (None: everyone), all by default
+        """
+        where, args = self._where("date", employee, start, end)
+        sql = (
+            f"SELECT employee, date, source, {', '.join(FIELDS)} FROM payslips"
+            f"{where} ORDER BY employee, date"
+        )
+        return self._query(sql, args, ["employee", "date"], cents)
+
+    def rollup(
+        self,
+        period: str = "monthly",
+        employee: Optional[str] = None,
+        start=None,
+        end=None,
+        cents: bool = False,
+    ) -> pd.DataFrame:
+        """
+        monthly totals for months start..end ("2022-01"), or yearly totals
+        for years start..end (2022); either takes any of "2022-01-01",
+        "2022-01" or "2022"
+        """
+        key = PERIODS[period][0]
+        where, args = self._where(key, employee, start, end)
+        sql = (
+            f"SELECT employee, {key}, payslips, {', '.join(ROLLUP_FIELDS)} "
+            f"FROM {period}{where} ORDER BY employee, {key}"
+        )
+        return self._query(sql, args, ["employee", key], cents)
+
+    def year_to_date(
+        self, month: str, employee: Optional[str] = None, cents: bool = False
+    ):
+        """
+        totals from january up to and including month ("2022-06"), of
+        employee or, with None, of everyone
+        """
+        sums = ", ".join(f"COALESCE(SUM({f}), 0) AS {f}" for f in ROLLUP_FIELDS)
+        where, args = self._where("month", employee, str(month)[:4], month)
+        sql = (
+            f"SELECT COALESCE(SUM(payslips), 0) AS payslips, {sums} FROM monthly{where}"
+        )
+        res = pd.read_sql_query(sql, self.conn, params=args).iloc[0]
+        return res if cents else res.where(res.index == "payslips", res / 100)
+
+    def month_over_month(
+        self, field: str = "actual_net_pay", employee: str = "", cents: bool = False
+    ) -> pd.DataFrame:
+        """
+        a monthly total and its change from the previous month with payslips
+        """
+        df = self.rollup("monthly", employee, cents=cents)[[field]]
+        df["change"] = df[field].diff()
+        df["change_pct"] = (100 * df["change"] / df[field].shift()).round(2)
+        return df.droplevel("employee")
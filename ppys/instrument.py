@@ -0,0 +1,259 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import pandas as pd
+
+
+@dataclass
+class FileStats:
+    """
+    seconds per stage (nested stages overlap their parent) and counters
+    for one payslip, or for a batch-level step such as export
+    """
+
+    source: str
+    stages: dict[str, float] = field(default_factory=dict)
+    counters: dict[str, int] = field(default_factory=dict)
+    total: float = 0.0
+
+    def merge(self, other: Optional["FileStats"]) -> None:
+        """
+        add the stages and counters recorded elsewhere (e.g. in a worker)
+        """
+        if other is None:
+            return
+        for k, v in other.stages.items():
+            self.stages[k] = self.stages.get(k, 0.0) + v
+        for k, v in other.counters.items():
+            self.counters[k] = self.counters.get(k, 0) + v
+        self.total += other.total
+
+
+class BudgetExceeded(Exception):
+    """
+    a stage ran longer, or left the process larger, than its budget allows
+    """
+
+    def __init__(self, stage: str, reason: str) -> None:
+        super().__init__(f"{stage}: {reason}")
+        self.stage = stage
+
+
+def rss_mb(pid="self") -> float:
+    """
+    resident memory of a process in MiB, from /proc; without /proc, the
+    peak resident memory of this process (0 for another one)
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        if pid != "self":
+            return 0.0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@dataclass
+class Budgets:
+    """
+    seconds per stage name (stages not listed are unbounded) and a ceiling on
+    resident memory (MiB, 0: none) checked as each stage ends
+    """
+
+    seconds: dict[str, float] = field(default_factory=dict)
+    rss_mb: float = 0.0
+
+    def check(self, name: str, elapsed: float) -> None:
+        limit = self.seconds.get(name, 0.0)
+        if limit and elapsed > limit:
+            raise BudgetExceeded(name, f"took {elapsed:.1f}s, budget {limit}s")
+        if self.rss_mb and (rss := rss_mb()) > self.rss_mb:
+            raise BudgetExceeded(name, f"rss {rss:.0f} MiB, budget {self.rss_mb} MiB")
+
+
+_current: ContextVar[Optional[FileStats]] = ContextVar("_current", default=None)
+_budgets: ContextVar[Optional[Budgets]] = ContextVar("_budgets", default=None)
+
+
+@contextmanager
+def timed_file(source, stats: Optional[FileStats] = None) -> Iterator[FileStats]:
+    """
+    stage() and count() calls inside the block are recorded for source
+    pass the stats of an earlier block to keep adding to them
+    """
+    stats = stats if stats is not None else FileStats(str(source))
+    token = _current.set(stats)
+    t0 = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.total += time.perf_counter() - t0
+        _current.reset(token)
+
+
+@contextmanager
+def budgets(limits: Budgets) -> Iterator[Budgets]:
+    """
+    stages inside the block raise BudgetExceeded when over limits
+    """
+    token = _budgets.set(limits)
+    try:
+        yield limits
+    finally:
+        _budgets.reset(token)
+
+
+def _on_alarm(name: str, limit: float, *args) -> None:
+    raise BudgetExceeded(name, f"interrupted after {limit}s")
+
+
+@contextmanager
+def _alarm(name: str, limit: float) -> Iterator[None]:
+    """
+    interrupt the stage once its budget is spent (SIGALRM, main thread only);
+    an enclosing stage's alarm due sooner is left alone and resumed after
+    """
+    if (
+        not limit
+        or not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+    outer = signal.getitimer(signal.ITIMER_REAL)[0]
+    if outer and outer <= limit:
+        yield
+        return
+    t0 = time.perf_counter()
+    previous = signal.signal(signal.SIGALRM, lambda *a: _on_alarm(name, limit, *a))
+    signal.setitimer(signal.ITIMER_REAL, limit)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+        if outer:
+            left = outer - (time.perf_counter() - t0)
+            signal.setitimer(signal.ITIMER_REAL, max(left, 0.001))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    time a stage of the current file, a no-op outside timed_file()
+    inside budgets() the stage is also held to its time and memory budget
+    """
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    limits = _budgets.get()
+    limit = limits.seconds.get(name, 0.0) if limits is not None else 0.0
+    t0 = time.perf_counter()
+    with _alarm(name, limit):
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            stats.stages[name] = stats.stages.get(name, 0.0) + elapsed
+    if limits is not None:
+        limits.check(name, elapsed)
+
+
+def count(name: str, n: int = 1) -> None:
+    stats = _current.get()
+    if stats is not None and n:
+        stats.counters[name] = stats.counters.get(name, 0) + n
+
+
+def write_jsonl(stats: Iterable[FileStats], filepath: Path) -> None:
+    """
+    one json line per file: source, total, stages (seconds) and counters
+    """
+    with open(filepath, "w") as f:
+        for x in stats:
+            f.write(json.dumps(asdict(x)) + "\n")
+
+
+def read_jsonl(filepath: Path) -> list[FileStats]:
+    with open(filepath) as f:
+        return [FileStats(**json.loads(line)) for line in f if line.strip()]
+
+
+def summary(stats: Iterable[FileStats]) -> pd.DataFrame:
+    """
+    per stage: files, total, mean, p50, p95 and max in ms; counters as totals
+    """
+    stats = list(stats)
+    rows = [(x.source, "total", x.total) for x in stats if x.stages]
+    rows += [(x.source, k, v) for x in stats for k, v in x.stages.items()]
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame(rows, columns=["source", "stage", "seconds"])
+    ms = df.assign(ms=1000 * df["seconds"]).groupby("stage")["ms"]
+    res = pd.DataFrame(
+        {
+            "files": ms.count(),
+            "total_ms": ms.sum(),
+            "mean_ms": ms.mean(),
+            "p50_ms": ms.median(),
+            "p95_ms": ms.quantile(0.95),
+            "max_ms": ms.max(),
+        }
+    ).sort_values("total_ms", ascending=False)
+    counters: dict[str, int] = {}
+    for x in stats:
+        for k, v in x.counters.items():
+            counters[k] = counters.get(k, 0) + v
+    res.attrs["counters"] = counters
+    return res.round(3)
+
+
+def slowest(stats: Iterable[FileStats], n: int = 10) -> pd.DataFrame:
+    """
+    the n slowest payslips with their stage breakdown (ms) and counters
+    """
+    rows = [
+        {"source": x.source, "total_ms": 1000 * x.total}
+        | {k: 1000 * v for k, v in x.stages.items()}
+        | x.counters
+        for x in stats
+        if x.stages
+    ]
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).nlargest(n, "total_ms").set_index("source").round(3)
+
+
+def profile(func, *args, tool: str = "cprofile", limit: int = 30, **kwargs) -> str:
+    """
+    run func(*args, **kwargs) once under cProfile or pyinstrument (if installed)
+    returns the report text
+    """
+    if tool == "pyinstrument":
+        from pyinstrument import Profiler  # optional dependency
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            func(*args, **kwargs)
+        finally:
+            profiler.stop()
+        return profiler.output_text()
+    profiler = cProfile.Profile()
+    profiler.runcall(func, *args, **kwargs)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
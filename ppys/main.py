@@ -3,12 +3,28 @@ import re
 import datetime
 from decimal import Decimal
 from pathlib import Path
-from pypdf import PdfReader
+from typing import Optional
 from dotenv import load_dotenv
 import pandas as pd
-import tabula
 
 import utils
+import archives
+import backends
+import decrypt
+import discovery
+import batch
+import export
+import instrument
+import mapping
+import pipeline
+import sinks
+from amounts import decimal_to_cents
+from records import FIELDS, PayslipRecord, RecordAccumulator
+from cache import PayslipCache, CACHE_FILENAME
+from history import HistoryStore
+from manifest import Manifest
+from pdfobject import PdfObject, PdfSource
+from scheduler import QUARANTINE_FILENAME, Quarantine, Scheduler
 from utils import MissingEnvVariables
 
 
@@ -24,92 +40,25 @@ SAP_AREA_DATE_BOX = [21.24, 44.17, 30.37, 69.48]
 SAP_AREA_PAYTABLE_BOX = [30.76, 4.58, 75.55, 39.14]
 SAP_AREA_PAY_SUMMARY_BOX = [30.89, 44.61, 40.02, 63.73]
 
-
-class PdfObject:
-    def __init__(self, filepath: Path) -> None:
-        if not filepath.is_file():
-            raise FileNotFoundError(f"{filepath=}")
-        self.filepath = filepath
-        self.raw_text = self.read_pdf(self.filepath)
-
-    def read_pdf(self, filepat: Path) -> str:
-        reader = PdfReader(filepat)
-        text_list = []
-        for i in range(len(reader.pages)):
-            page = reader.pages[i]
-            text_list.append(page.extract_text())
-        return "\n\n".join(text_list)
-
-    def get_paytable(self, area: list[float]) -> pd.DataFrame:
-        dfs = tabula.io.read_pdf(
-            self.filepath,
-            pages=[1],
-            pandas_options={"header": None},
-            area=area,  # [top, left, bottom, right]
-            relative_area=True,  # enables % from area argument
-        )
-        if not isinstance(dfs, list):
-            dfs = [pd.DataFrame()]
-        return dfs[0]
-
-    def get_deductions_table(self, area: list[float]) -> pd.DataFrame:
-        dfs = tabula.io.read_pdf(
-            self.filepath,
-            pages=[1],
-            pandas_options={"header": None},
-            area=area,  # [top, left, bottom, right]
-            relative_area=True,  # enables % from area argument
-        )
-        if not isinstance(dfs, list):
-            dfs = [pd.DataFrame()]
-        return dfs[0]
-
-    def get_pay_summary_table(
-        self, area: list[float], pandas_options: dict = {"header": None}
-    ) -> pd.DataFrame:
-        dfs = tabula.io.read_pdf(
-            self.filepath,
-            pages=[1],
-            pandas_options=pandas_options,
-            area=area,  # [top, left, bottom, right]
-            relative_area=True,  # enables % from area argument
-        )
-        if not isinstance(dfs, list):
-            dfs = [pd.DataFrame()]
-        return dfs[0]
-
-    def get_pay(self):
-        descr_index_start = self.raw_text.find("DESCRIPTION")
-        descr_index_end = self.raw_text[descr_index_start:].find("\n\n")
-        if descr_index_end == -1:
-            descr_index_end = self.raw_text[descr_index_start:].find("\n \n")
-        if descr_index_end != -1:
-            descr_index_end += descr_index_start
-
-        pay_text = self.raw_text[descr_index_start:descr_index_end]
-        # print(f"{self.raw_text[descr_index_start:]=}")
-        print(f"{descr_index_start=}, {descr_index_end=}")
-        print(f"{pay_text}")
-
-        pay_numbers = []
-        for line in pay_text.splitlines():
-            try:
-                pay_numbers.append(float(line.replace(",", "")))
-            except ValueError:
-                pass
-        print(f"{pay_numbers=}")
-        number_of_pay_items = len(pay_numbers) - 1
-
-        pay_headers = []
-        print("\n\n")
-
-    def save_to_textfile(self, txtstr: str, filepath: Path) -> None:
-        with open(filepath, "w") as writer:
-            writer.write(txtstr)
-        lg.info(f"saved to {filepath.name}")
+FLEXHR_AREAS = {
+    "date": AREA_DATE_BOX,
+    "paytable": AREA_PAYTABLE_BOX,
+    "deductions": AREA_DEDUCTIONS_BOX,
+    "pay_summary": AREA_PAYSUMMARY_BOX,
+}
+SAP_AREAS = {
+    "date": SAP_AREA_DATE_BOX,
+    "paytable": SAP_AREA_PAYTABLE_BOX,
+    "pay_summary": SAP_AREA_PAY_SUMMARY_BOX,
+}
 
 
 class Payslip(PdfObject):
+    layout: str = ""
+    areas: dict[str, list[float]] = {}
+    table_headers: dict[str, int] = {}
+    markers: list[str] = []
+    tables: Optional[dict[str, pd.DataFrame]]
     date: datetime.date
     actual_net_pay: Decimal
     accounting_pay: Decimal
@@ -126,7 +75,8 @@ class Payslip(PdfObject):
 
     def __init__(
         self,
-        filepath: Path,
+        filepath: PdfSource,
+        backend: Optional[backends.TabulaBackend] = None,
         basic_pay: str = "",
         bonus_pay: str = "",
         aws_pay: str = "",
@@ -137,8 +87,13 @@ class Payslip(PdfObject):
         cpf_employer: str = "",
         allowances_pckg: str = "",
         allowances_work: str = "",
+        passwords: Optional[tuple[str, ...]] = None,
+        name: str = "",
     ):
-        super().__init__(filepath)
+        super().__init__(filepath, backend=backend, passwords=passwords, name=name)
+        self.tables = None
+        self.unmatched_labels: list[str] = []
+        self.parse_warnings: list[str] = []
         self.date = datetime.date(year=1, month=1, day=1)
         self.accounting_pay = Decimal("0.00")
         self.basic_pay = Decimal("0.00") if not basic_pay else Decimal(basic_pay)
@@ -177,7 +132,50 @@ class Payslip(PdfObject):
         allowances_pckg={self.allowances_pckg},
         )"""
 
-    def crunch_data(self) -> pd.DataFrame:
+    def get_layout_tables(self) -> dict[str, pd.DataFrame]:
+        if self.tables is None:
+            with instrument.stage("extract"):
+                self.tables = self.get_tables(self.areas, self.table_headers)
+        return self.tables
+
+    def get_layout_table(self, name: str) -> pd.DataFrame:
+        return self.get_layout_tables()[name].copy()
+
+    def apply_mapping(self, table: str, descr: pd.Series, amt: pd.Series) -> None:
+        """
+        add the amounts of every mapped label (see mappings.csv) to its field
+        """
+        with instrument.stage("mapping"):
+            res = mapping.apply_mapping(
+                descr, amt, mapping.get_mapping(self.layout, table)
+            )
+            for name, value in res.values.items():
+                setattr(self, name, getattr(self, name) + value)
+        instrument.count("missed_keywords", len(res.missing))
+        instrument.count("invalid_amounts", len(res.invalid))
+        instrument.count("unmatched_labels", len(res.unmatched))
+        instrument.count("parse_warnings", len(res.missing) + len(res.invalid))
+        self.parse_warnings += [f"{kw} not found in {table}" for kw in res.missing]
+        self.parse_warnings += [f"{kw} invalid amount" for kw in res.invalid]
+        if res.unmatched:
+            lg.debug("unmatched labels in %s: %s", table, res.unmatched)
+        self.unmatched_labels += res.unmatched
+        lg.debug("updated data_entries=%s", res.matched)
+
+    @classmethod
+    def match_layout(cls, text: str) -> int:
+        """
+        number of this layout's text markers found in the page text
+        """
+        return sum(marker in text for marker in cls.markers)
+
+    def parse(self) -> "Payslip":
+        """
+        run every get_* step of the layout, ready for crunch()
+        """
+        raise NotImplementedError
+
+    def crunch(self) -> PayslipRecord:
         self.deductable_cpf = self.cpf_employee
         self.deductable_pay = self.deductable_cdc + self.deductable_cpf
         self.accounting_pay = (
@@ -185,30 +183,43 @@ class Payslip(PdfObject):
         )
 
         self.actual_net_pay = self.accounting_pay + self.allowances_work
-        df = pd.DataFrame(
-            index=[self.date],
-            data=[
-                {
-                    "accounting_pay": self.accounting_pay,
-                    "actual_net_pay": self.actual_net_pay,
-                    "basic_pay": self.basic_pay,
-                    "bonus_pay": self.bonus_pay,
-                    "aws_pay": self.aws_pay,
-                    "deductable_cpf": self.deductable_cpf,
-                    "deductable_cdc": self.deductable_cdc,
-                    "deductable_pay": self.deductable_pay,
-                    "cpf_employee": self.cpf_employee,
-                    "cpf_employer": self.cpf_employer,
-                    "allowances_pckg": self.allowances_pckg,
-                    "allowances_work": self.allowances_work,
-                }
-            ],
+        self.log_parse_warnings()
+        return PayslipRecord(
+            date=self.date,
+            **{name: decimal_to_cents(getattr(self, name)) for name in FIELDS},
         )
 
-        return df
+    def log_parse_warnings(self) -> None:
+        """
+        one warning line per payslip for everything parse() could not find
+        """
+        if self.parse_warnings:
+            lg.warning(
+                "%s: %d parse errors: %s",
+                self.filepath.name,
+                len(self.parse_warnings),
+                "; ".join(self.parse_warnings),
+            )
+            self.parse_warnings = []
+
+    def crunch_data(self) -> pd.DataFrame:
+        acc = RecordAccumulator(capacity=1)
+        acc.append(self.crunch())
+        return acc.to_frame()
 
 
 class FlexHRPayslip(Payslip):
+    layout = "flexhr"
+    areas = FLEXHR_AREAS
+    table_headers = {"pay_summary": 0}
+    markers = [
+        "PERIOD",
+        "BASIC PAY",
+        "TOTAL DEDUCTIONS",
+        "CPF CONTRIBUTION - EMPLOYEE",
+        "CURRENT EARNING",
+    ]
+
     @staticmethod
     def change_df_columns_descr_amt(df):
         cols = list(df.columns)
@@ -217,10 +228,22 @@ class FlexHRPayslip(Payslip):
         df.columns = cols
         return df
 
+    def parse(self) -> "FlexHRPayslip":
+        self.get_pay_date()
+        self.get_paytable()
+        self.get_pay_summary_table()
+        self.get_deductions_table()
+        return self
+
     def get_pay_date(self) -> datetime.date:
-        df = super().get_paytable(area=AREA_DATE_BOX)
+        df = self.get_layout_table("date")
         df.set_index(df.columns[0], inplace=True)
-        raw_date = df.loc["PERIOD", 1]
+        try:
+            raw_date = df.loc["PERIOD", 1]
+        except KeyError:
+            raise ValueError(
+                f"{self.filepath.name}: no PERIOD in the date area"
+            ) from None
         if raw_date:
             res = str(raw_date).strip(":").strip()
             res = datetime.datetime.strptime(res, "%b-%Y")
@@ -228,146 +251,65 @@ class FlexHRPayslip(Payslip):
         return self.date
 
     def get_paytable(self) -> pd.DataFrame:
-        df = super().get_paytable(area=AREA_PAYTABLE_BOX)
+        df = self.get_layout_table("paytable")
         df = self.change_df_columns_descr_amt(df)
+        self.apply_mapping("paytable", df["descr"], df["amt"])
         df.set_index(df.columns[0], inplace=True)
-        data_entries = []
-        column_current = "amt"
-        try:
-            kw = "BASIC PAY"
-            basic_pay = df.loc[kw, column_current].replace(",", "")
-            self.basic_pay = Decimal(basic_pay)
-            data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"basic_pay parse error: {e=}")
-
-        # PROSPERITY ANG BAO *
-        try:
-            for kw in [
-                "PROSPERITY ANG BAO *",
-                "URGENT TASK ALLOWANCE (A)",
-                "TAXI CLAIM *",
-            ]:
-                try:
-                    value = df.loc[kw, column_current].replace(",", "")
-                except KeyError:
-                    continue
-                if value:
-                    self.allowances_work += Decimal(value)
-                    data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"allowances_pckg parse error: {e=}")
-
-        try:
-            for kw in [
-                "MOBILE PHONE SUBSIDY",
-                "EXECUTIVE HEALTH SCREENING",
-                "HEALTH INSURANCE PREMIUM (SELF",
-            ]:
-                try:
-                    value = df.loc[kw, column_current].replace(",", "")
-                except KeyError:
-                    continue
-                if value:
-                    self.allowances_pckg += Decimal(value)
-                    data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"allowances_pckg parse error: {e=}")
-
-        try:
-            for kw in [
-                "PROFIT SHARING",
-                "RETENTION BONUS",
-                "VARIABLE SALARY BONUS",
-                "SEVERANCE PAY",
-                "LEAVE ENCASHMENT",
-                "ANNUAL WAGE SUPPLEMENT",
-                "NOTICE IN LIEU_COMPANY",
-                "LONG SERVICE AWARD - 3 YEARS",
-            ]:
-                try:
-                    value = df.loc[kw, column_current].replace(",", "")
-                except KeyError:
-                    continue
-                if value:
-                    self.bonus_pay += Decimal(value)
-                    data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"bonus_pay parse error: {e=}")
-
-        lg.info(f"updated {data_entries=}")
         return df
 
     def get_deductions_table(self) -> pd.DataFrame:
-        df = super().get_deductions_table(area=AREA_DEDUCTIONS_BOX)
+        df = self.get_layout_table("deductions")
         df = self.change_df_columns_descr_amt(df)
+        self.apply_mapping("deductions", df["descr"], df["amt"])
         df.set_index(df.columns[0], inplace=True)
-        data_entries = []
-        column_current = "amt"
-        try:
-            kw = "CHINESE DEVELOPMENT ASSISTANC"
-            deductable_cdc = str(df.loc[kw, column_current])
-            deductable_cdc = deductable_cdc.replace(",", "").replace("-", "")
-            self.deductable_cdc = Decimal(deductable_cdc)
-            data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"deductable_cdc parse error: {e=}")
-        try:
-            kw = "CPF CONTRIBUTION - EMPLOYEE"
-            deductable_cpf = str(df.loc[kw, column_current])
-            deductable_cpf = deductable_cpf.replace(",", "").replace("-", "")
-            self.deductable_cpf = Decimal(deductable_cpf)
-            data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"deductable_cpf parse error: {e=}")
-        try:
-            kw = "TOTAL DEDUCTIONS"
-            deductable_pay = str(df.loc[kw, column_current])
-            deductable_pay = deductable_pay.replace(",", "").replace("-", "")
-            self.deductable_pay = Decimal(deductable_pay)
-            data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"deductable_pay parse error: {e=}")
-        lg.info(f"updated {data_entries=}")
         return df
 
     def get_pay_summary_table(self) -> pd.DataFrame:
-        df = super().get_pay_summary_table(
-            area=AREA_PAYSUMMARY_BOX, pandas_options={"header": 0}
-        )
+        df = self.get_layout_table("pay_summary")
         cols = list(df.columns)
         cols[0] = "descr"
         df.columns = cols
-        df.set_index("descr", inplace=True)
-        data_entries = []
         column_current = "CURRENT EARNING"
-        kw = "Employee CPF"
-        try:
-            cpf_employee = str(df.loc[kw, column_current]).replace(",", "")
-            self.cpf_employee = Decimal(cpf_employee)
-            data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"{kw} parse error: {e=}")
-        kw = "Employer CPF"
-        try:
-            cpf_employer = str(df.loc[kw, column_current]).replace(",", "")
-            self.cpf_employer = Decimal(cpf_employer)
-            data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"{kw} parse error: {e=}")
-        lg.info(f"updated {data_entries=}")
+        if column_current in df.columns:
+            self.apply_mapping("pay_summary", df["descr"], df[column_current])
+        else:
+            self.parse_warnings.append(f"{column_current} column not found")
+            instrument.count("parse_warnings")
+        df.set_index("descr", inplace=True)
         return df
 
 
 class SAPPayslip(Payslip):
-    def __init__(self, filepath: Path):
-        super().__init__(filepath=filepath)
+    layout = "sap"
+    areas = SAP_AREAS
+    markers = [
+        "Basic Salary",
+        "CPF Employee",
+        "CPF Employer",
+        "Fund - CDAC",
+    ]
+
+    def __init__(
+        self,
+        filepath: PdfSource,
+        backend: Optional[backends.TabulaBackend] = None,
+        passwords: Optional[tuple[str, ...]] = None,
+        name: str = "",
+    ):
+        super().__init__(
+            filepath=filepath, backend=backend, passwords=passwords, name=name
+        )
 
     def __repr__(self) -> str:
         return super().__repr__()
 
+    def parse(self) -> "SAPPayslip":
+        self.get_pay_date()
+        self.get_paytable()
+        return self
+
     def get_pay_date(self) -> datetime.date:
-        df = super().get_paytable(area=SAP_AREA_DATE_BOX)
+        df = self.get_layout_table("date")
         payperiod_text = str(df.iloc[0, 0])
         date_end = payperiod_text.split("to")[-1].strip()
         date_end = datetime.datetime.strptime(date_end, "%d/%m/%Y")
@@ -375,141 +317,321 @@ class SAPPayslip(Payslip):
         return self.date
 
     def get_paytable(self) -> pd.DataFrame:
-        df0 = super().get_paytable(area=SAP_AREA_PAYTABLE_BOX)
+        df0 = self.get_layout_table("paytable")
         df0.columns = ["descr", "amt"]
-        df0["amt"] = df0["amt"].apply(
-            lambda x: x.strip("+").strip("-").replace(",", "")
-        )
 
-        df1 = super().get_paytable(area=SAP_AREA_PAY_SUMMARY_BOX)
+        df1 = self.get_layout_table("pay_summary")
         df1.columns = ["descr", "amt"]
 
         df = pd.concat([df0, df1])
+        self.apply_mapping("paytable", df["descr"], df["amt"])
         df.set_index("descr", inplace=True)
+        return df
 
-        column_current = "amt"
-        data_entries = []
-
-        kw = "Basic Salary"
-        try:
-            basic_pay = str(df.loc[kw, column_current])
-            self.basic_pay = Decimal(basic_pay)
-            data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"{kw} parse error: {e=}")
 
-        kw = "CPF Employee"
-        try:
-            cpf_employee = str(df.loc[kw, column_current])
-            self.cpf_employee = Decimal(cpf_employee)
-            data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"{kw} parse error: {e=}")
-
-        kw = "CPF Employer"
-        try:
-            cpf_employer = str(df.loc[kw, column_current])
-            self.cpf_employer = Decimal(cpf_employer)
-            data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"{kw} parse error: {e=}")
-
-        for kw in [
-            "Mobile Phone Subsidy",
-            "Executive Health Screening",
-            "Flex Benefit - Optical",
-            "Health Insurance Premium (Self)",
-        ]:
-            try:
-                val = str(df.loc[kw, column_current])
-                self.allowances_pckg += Decimal(val)
-                data_entries.append(kw)
-            except Exception as e:
-                lg.warning(f"{kw} parse error: {e=}")
-
-        for kw in [
-            "Profit Sharing Bonus",
-            "Annual Wage Supplement",
-        ]:
-            try:
-                val = str(df.loc[kw, column_current])
-                self.bonus_pay += Decimal(val)
-                data_entries.append(kw)
-            except Exception as e:
-                lg.warning(f"{kw} parse error: {e=}")
-
-        for kw in [
-            "Urgent Task Allowance (O)",
-            "Urgent Task Allowance (A)",
-            "Prosperity Ang Bao",
-            "Specialist",
-            "Factory/Production supplies",
-            "Compassionate Token",
-            "Entertainment",
-            "Lucky Draw_Non-Taxable",
-            "Taxi Claim",
-        ]:
-            try:
-                val = str(df.loc[kw, column_current])
-                self.allowances_work += Decimal(val)
-                data_entries.append(kw)
-            except Exception as e:
-                lg.warning(f"{kw} parse error: {e=}")
-
-        kw = "Fund - CDAC"
-        try:
-            val = str(df.loc[kw, column_current])
-            self.deductable_cdc += Decimal(val)
-            data_entries.append(kw)
-        except Exception as e:
-            lg.warning(f"{kw} parse error: {e=}")
-
-        return df
+LAYOUTS = [FlexHRPayslip, SAPPayslip]
 
 
 def load_environment():
+    """
+    PASSWORD (and/or PASSWORD_FILE, one password per line) from .env
+    worker processes inherit them through the environment
+    """
     load_dotenv()
     global PASSWORD
     PASSWORD = os.getenv("PASSWORD")
-    if not PASSWORD:
+    decrypt.get_passwords.cache_clear()
+    if not decrypt.get_passwords():
         raise MissingEnvVariables("PASSWORD")
-    print(f"{PASSWORD=}")
-
-
-def load_ams_payslips_2022():
-    pathfinder = utils.PathFinder()
-    dflist = []
-    for i, payslip in enumerate(pathfinder.get_payslips()):
-        ps = FlexHRPayslip(payslip)
-        ps.get_pay_date()
-        ps.get_paytable()
-        ps.get_pay_summary_table()
-        ps.get_deductions_table()
-        dflist.append(ps.crunch_data())
-        # break
-    outname = "output.xlsx"
-    df = pd.concat(dflist)
+    lg.info("%d payslip password(s) loaded", len(decrypt.get_passwords()))
+
+
+def open_cache(
+    pathfinder: utils.PathFinder, max_entries: int = 0, max_age_days: float = 0
+) -> PayslipCache:
+    """
+    the parse cache every loader shares, next to the repo
+    """
+    return PayslipCache(
+        pathfinder.cwd / CACHE_FILENAME,
+        max_entries=max_entries,
+        max_age_days=max_age_days,
+    )
+
+
+def find_payslips(
+    pathfinder: utils.PathFinder,
+    roots: Optional[list[str]] = None,
+    exclude: tuple[str, ...] = (),
+):
+    """
+    the pdfs next to the repo by default, or a lazy recursive walk of roots
+    a root that is a zip/tar archive yields its members, named by member name
+    """
+    if not roots:
+        return pathfinder.get_payslips()
+    return _walk_roots(roots, exclude)
+
+
+def _walk_roots(roots: list[str], exclude: tuple[str, ...] = ()):
+    for root in roots:
+        if archives.is_archive(root):
+            yield from archives.iter_members(Path(root), exclude=exclude)
+        else:
+            yield from discovery.walk_payslips([root], exclude=exclude)
+
+
+def load_ams_payslips_2022(
+    backend_name: str = "",
+    workers: int = 1,
+    output: str = "output.xlsx",
+    xlsx: bool = False,
+    cache_max_entries: int = 0,
+    cache_max_age_days: float = 0,
+):
+    pathfinder = utils.PathFinder(resources_foldername="")
+    with open_cache(pathfinder, cache_max_entries, cache_max_age_days) as cache:
+        result = batch.run_batch(
+            pathfinder.get_payslips(),
+            FlexHRPayslip,
+            workers=workers,
+            backend_name=backend_name,
+            cache=cache,
+        )
+    df = result.data
     print(df)
-    df.to_excel("output.xlsx")
-    lg.info(f"exported {outname}")
-
-
-def load_ams_payslips_2021():
-    pathfinder = utils.PathFinder()
-    dflist = []
-    for i, payslip in enumerate(pathfinder.get_payslips()):
-        ps = SAPPayslip(payslip)
-        ps.get_pay_date()
-        ps.get_paytable()
-        dflist.append(ps.crunch_data())
-
-    outname = "output.xlsx"
-    df = pd.concat(dflist)
+    export.export_frame(df, Path(output), xlsx=xlsx)
+
+
+def load_ams_payslips_2021(
+    backend_name: str = "",
+    workers: int = 1,
+    output: str = "output.xlsx",
+    xlsx: bool = False,
+    cache_max_entries: int = 0,
+    cache_max_age_days: float = 0,
+):
+    pathfinder = utils.PathFinder(resources_foldername="")
+    with open_cache(pathfinder, cache_max_entries, cache_max_age_days) as cache:
+        result = batch.run_batch(
+            pathfinder.get_payslips(),
+            SAPPayslip,
+            workers=workers,
+            backend_name=backend_name,
+            cache=cache,
+        )
+    df = result.data
+    print(df)
+    export.export_frame(df, Path(output), xlsx=xlsx)
+
+
+def load_payslips(
+    backend_name: str = "",
+    workers: int = 1,
+    output: str = "output.xlsx",
+    xlsx: bool = False,
+    roots: Optional[list[str]] = None,
+    exclude: tuple[str, ...] = (),
+    timings: str = "",
+    history: str = "",
+    employee: str = "",
+    cache_max_entries: int = 0,
+    cache_max_age_days: float = 0,
+):
+    """
+    load a directory mixing FlexHR and SAP payslips, layout detected per file
+    roots (searched recursively, minus exclude globs) replace the default dir
+    timings names a json lines file for per-file stage timings and counters
+    history names a HistoryStore the payslips are also filed in, under employee
+    the parse cache keeps at most cache_max_entries payslips, dropping those
+    unused for cache_max_age_days (0: no limit)
+    """
+    pathfinder = utils.PathFinder(resources_foldername="")
+    with open_cache(pathfinder, cache_max_entries, cache_max_age_days) as cache:
+        result = batch.run_batch(
+            find_payslips(pathfinder, roots, exclude),
+            LAYOUTS,
+            workers=workers,
+            backend_name=backend_name,
+            cache=cache,
+        )
+    df = result.data
+    print(df)
+    with instrument.timed_file("<export>") as export_stats:
+        export.export_frame(df, Path(output), xlsx=xlsx)
+    if history:
+        with HistoryStore(Path(history)) as store:
+            store.add_frame(df, employee)
+    if timings:
+        report_timings(result.stats + [export_stats], Path(timings))
+
+
+def load_payslips_isolated(
+    backend_name: str = "",
+    workers: int = 1,
+    output: str = "output.xlsx",
+    xlsx: bool = False,
+    roots: Optional[list[str]] = None,
+    exclude: tuple[str, ...] = (),
+    timings: str = "",
+    file_timeout: float = 120.0,
+    retries: int = 1,
+    cache_max_entries: int = 0,
+    cache_max_age_days: float = 0,
+):
+    """
+    like load_payslips, but every payslip is parsed in a worker process under
+    a per-file timeout and per-stage budgets (see scheduler.Scheduler)
+    files failing for good are quarantined and skipped by later runs,
+    the run report is written next to output
+    """
+    pathfinder = utils.PathFinder(resources_foldername="")
+    with Quarantine(pathfinder.cwd / QUARANTINE_FILENAME) as quarantine, open_cache(
+        pathfinder, cache_max_entries, cache_max_age_days
+    ) as cache:
+        scheduler = Scheduler(
+            LAYOUTS,
+            backend_name=backend_name,
+            workers=workers,
+            file_timeout=file_timeout,
+            retries=retries,
+            quarantine=quarantine,
+            cache=cache,
+        )
+        result = scheduler.run(find_payslips(pathfinder, roots, exclude))
+    df = result.data
     print(df)
-    df.to_excel("output.xlsx")
-    lg.info(f"exported {outname}")
+    print(scheduler.report)
+    export.export_frame(df, Path(output), xlsx=xlsx)
+    scheduler.report.write(Path(output).with_suffix(".report.json"))
+    if timings:
+        report_timings(result.stats, Path(timings))
+
+
+def sync_payslips(
+    backend_name: str = "",
+    workers: int = 1,
+    output: str = "output.parquet",
+    roots: Optional[list[str]] = None,
+    exclude: tuple[str, ...] = (),
+    history: str = "",
+    employee: str = "",
+    cache_max_entries: int = 0,
+    cache_max_age_days: float = 0,
+):
+    """
+    incremental load: only new or modified payslips (per the manifest kept
+    next to output) are parsed and merged into the existing output
+    roots must be directories, the manifest tracks files on disk
+    history names a HistoryStore kept in step with output, under employee
+    """
+    if roots and any(archives.is_archive(x) for x in roots):
+        raise ValueError("sync_payslips works on directories, not archives")
+    pathfinder = utils.PathFinder(resources_foldername="")
+    outpath = Path(output)
+    with Manifest(outpath.with_suffix(".manifest.sqlite")) as manifest:
+        if not outpath.is_file():
+            manifest.clear()
+        todo, removed = manifest.diff(find_payslips(pathfinder, roots, exclude))
+        if not todo and not removed:
+            lg.info("%s is up to date", outpath.name)
+            return
+        with open_cache(pathfinder, cache_max_entries, cache_max_age_days) as cache:
+            result = batch.run_batch(
+                todo,
+                LAYOUTS,
+                workers=workers,
+                backend_name=backend_name,
+                cache=cache,
+            )
+        # deleted since they were parsed: drop them like removed files
+        gone = [str(fp) for fp in result.parsed if not fp.is_file()]
+        removed += gone
+        df = result.data
+        if gone:
+            df = df[~df["source"].isin(gone)]
+        stale = set(map(str, todo)) | set(removed)
+        if history:
+            with HistoryStore(Path(history)) as store:
+                store.remove(stale)
+                store.add_frame(df, employee)
+        if outpath.is_file():
+            existing = export.read_frame(outpath)
+            if "source" in existing:
+                existing = existing[~existing["source"].isin(stale)]
+            df = pd.concat([existing, df]).sort_index(kind="stable")
+        export.export_frame(df, outpath)
+        for fp in result.parsed:
+            if str(fp) not in gone:
+                manifest.record(fp)
+        manifest.forget(removed)
+
+
+def stream_payslips(
+    output: str = "output.csv",
+    backend_name: str = "",
+    workers: int = 1,
+    resume: bool = True,
+    roots: Optional[list[str]] = None,
+    exclude: tuple[str, ...] = (),
+    timings: str = "",
+    cache_max_entries: int = 0,
+    cache_max_age_days: float = 0,
+):
+    """
+    stream every payslip into an append-only csv/sqlite output as it is parsed
+    a rerun after a crash continues after the last committed file
+    with roots, parsing starts while the directory walk is still going
+    """
+    pathfinder = utils.PathFinder(resources_foldername="")
+    outpath = Path(output)
+    with open_cache(pathfinder, cache_max_entries, cache_max_age_days) as cache:
+        with sinks.get_sink(outpath) as sink:
+            stats = pipeline.run_pipeline(
+                find_payslips(pathfinder, roots, exclude),
+                LAYOUTS,
+                sink,
+                cache=cache,
+                backend_name=backend_name,
+                workers=workers,
+                resume=resume,
+            )
+    lg.info("exported %s", outpath.name)
+    if timings:
+        report_timings(stats.files, Path(timings))
+
+
+def report_timings(stats: list[instrument.FileStats], filepath: Path) -> None:
+    """
+    write per-file timings to filepath and log the per-stage summary
+    """
+    instrument.write_jsonl(stats, filepath)
+    df = instrument.summary(stats)
+    lg.info("timings per stage (ms), %s:\n%s", filepath.name, df)
+    lg.info("counters: %s", df.attrs.get("counters", {}))
+    lg.info("slowest payslips (ms):\n%s", instrument.slowest(stats, n=5))
+
+
+def profile_payslip(filepath: Path, backend_name: str = "", tool: str = "cprofile"):
+    """
+    profile the parse of a single payslip with cProfile (or pyinstrument)
+    """
+    payslip_cls = batch.detect_layout(filepath, LAYOUTS)
+    if payslip_cls is None:
+        raise ValueError(f"unknown payslip layout: {filepath.name}")
+    report = instrument.profile(
+        batch.parse_one, payslip_cls, filepath, backend_name, tool=tool
+    )
+    print(report)
+    return report
 
 
 if __name__ == "__main__":
-    load_ams_payslips_2021()
+    load_payslips()
+    # load_payslips(output="output.parquet", xlsx=True)
+    # sync_payslips(output="output.parquet")
+    # load_payslips(timings="timings.jsonl")
+    # profile_payslip(Path("slow_payslip.pdf"))
+    # load_ams_payslips_2021()
+    # load_ams_payslips_2021(backend_name="jvm", workers=os.cpu_count())
     # load_ams_payslips_2022()
@@ -0,0 +1,108 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable
+
+import utils
+from cache import file_hash
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+
+class Manifest:
+    """
+    sqlite record of every processed file: path, size, mtime and content hash
+    diff() tells which files are new or changed since they were recorded
+    """
+
+    def __init__(self, filepath: Path) -> None:
+        self.filepath = filepath
+        self.conn = sqlite3.connect(filepath)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                processed_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def diff(self, filepaths: Iterable[Path]) -> tuple[list[Path], list[str]]:
+        """
+        returns (new or changed files, paths recorded before but now gone)
+        size + mtime is checked first, the content hash only when they differ
+        a file deleted between discovery and its check counts as gone
+        """
+        known = {
+            path: (size, mtime_ns, content_hash)
+            for path, size, mtime_ns, content_hash in self.conn.execute(
+                "SELECT path, size, mtime_ns, content_hash FROM files"
+            )
+        }
+        todo = []
+        seen = set()
+        for fp in filepaths:
+            entry = known.get(str(fp))
+            try:
+                changed = entry is None or self._changed(fp, *entry)
+            except FileNotFoundError:
+                lg.info("%s was deleted while syncing", fp.name)
+                continue
+            seen.add(str(fp))
+            if changed:
+                todo.append(fp)
+        removed = [path for path in known if path not in seen]
+        lg.info(
+            "manifest: %d new or changed, %d removed, %d unchanged",
+            len(todo),
+            len(removed),
+            len(seen) - len(todo),
+        )
+        return todo, removed
+
+    def _changed(
+        self, filepath: Path, size: int, mtime_ns: int, content_hash: str
+    ) -> bool:
+        st = filepath.stat()
+        if (size, mtime_ns) == (st.st_size, st.st_mtime_ns):
+            return False
+        if content_hash == file_hash(filepath):
+            # touched but identical, refresh the stat so it is not hashed again
+            self.record(filepath, content_hash)
+            return False
+        return True
+
+    def record(self, filepath: Path, content_hash: str = "") -> None:
+        st = filepath.stat()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+            (
+                str(filepath),
+                st.st_size,
+                st.st_mtime_ns,
+                content_hash if content_hash else file_hash(filepath),
+                time.time(),
+            ),
+        )
+
+    def forget(self, paths: Iterable[str]) -> None:
+        self.conn.executemany("DELETE FROM files WHERE path=?", [(p,) for p in paths])
+
+    def clear(self) -> None:
+        self.conn.execute("DELETE FROM files")
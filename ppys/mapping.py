@@ -0,0 +1,119 @@
+import hashlib
+from dataclasses import dataclass, field
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+import amounts
+
+
+MAPPINGS_FILE = Path(__file__).parent / "mappings.csv"
+RULES = ("keep", "abs")
+
+_mappings: Optional[pd.DataFrame] = None
+
+
+@dataclass(frozen=True)
+class TableMapping:
+    """
+    the mapping of one layout table as plain lookups, label -> field
+    """
+
+    fields: dict[str, str]
+    abs_labels: frozenset[str]
+    required: tuple[str, ...]
+    optional: tuple[str, ...]
+
+
+@dataclass
+class MappingResult:
+    values: dict[str, Decimal] = field(default_factory=dict)
+    matched: list[str] = field(default_factory=list)
+    unmatched: list[str] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+    invalid: list[str] = field(default_factory=list)
+
+
+def load_mappings(filepath: Path = MAPPINGS_FILE) -> pd.DataFrame:
+    """
+    mapping table: layout, table, label -> target Payslip field + cleanup rule
+    rule "keep" keeps the sign of the amount as printed, "abs" drops it
+    required labels are reported when they are missing from a table
+    """
+    df = pd.read_csv(filepath, dtype=str, keep_default_na=False)
+    df["required"] = df["required"] == "1"
+    bad_rules = set(df["rule"]) - set(RULES)
+    if bad_rules:
+        raise ValueError(f"unknown mapping rules {bad_rules} in {filepath.name}")
+    return df
+
+
+def get_mappings() -> pd.DataFrame:
+    global _mappings
+    if _mappings is None:
+        _mappings = load_mappings()
+    return _mappings
+
+
+@lru_cache(maxsize=None)
+def get_mapping(layout: str, table: str) -> TableMapping:
+    """
+    returns the mapping of one layout table, built once per process
+    """
+    df = get_mappings()
+    df = df[(df["layout"] == layout) & (df["table"] == table)]
+    return TableMapping(
+        fields=dict(zip(df["label"], df["field"])),
+        abs_labels=frozenset(df["label"][df["rule"] == "abs"]),
+        required=tuple(df["label"][df["required"]]),
+        optional=tuple(df["label"][~df["required"]]),
+    )
+
+
+def mappings_hash(layout: str) -> str:
+    df = get_mappings()
+    rows = df[df["layout"] == layout].to_csv(index=False)
+    return hashlib.sha256(rows.encode()).hexdigest()
+
+
+def apply_mapping(
+    descr: pd.Series, amt: pd.Series, mapping: TableMapping
+) -> MappingResult:
+    """
+    match every extracted label against the mapping with dict lookups; the
+    amounts of matched labels are parsed together to exact cents and summed
+    per target field (payslip tables are ~10 rows, frames would cost more)
+    """
+    res = MappingResult()
+    known: list[tuple[str, object]] = []
+    for label, amount in zip(descr.tolist(), amt.tolist()):
+        if pd.isna(label):
+            continue
+        label = str(label)
+        if label in mapping.fields:
+            known.append((label, amount))
+        else:
+            res.unmatched.append(label)
+    if known:
+        cents = amounts.parse_amounts(pd.Series([x[1] for x in known], dtype=object))
+    else:
+        cents = []
+    totals: dict[str, int] = {}
+    for (label, amount), value in zip(known, cents):
+        if value is pd.NA:
+            if not amounts.is_blank(amount):
+                res.invalid.append(f"{label}={amount}")
+            continue
+        value = int(value)
+        if label in mapping.abs_labels:
+            value = abs(value)
+        field_name = mapping.fields[label]
+        totals[field_name] = totals.get(field_name, 0) + value
+        res.matched.append(label)
+    res.values = {name: amounts.cents_to_decimal(x) for name, x in totals.items()}
+    matched = set(res.matched)
+    res.missing = [label for label in mapping.required if label not in matched]
+    return res
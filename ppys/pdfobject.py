@@ -0,0 +1,216 @@
+import io
+import mmap
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+
+import pandas as pd
+from pypdf import PdfReader
+
+import utils
+import backends
+import decrypt
+import instrument
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+
+PdfSource = Union[Path, bytes, memoryview, BinaryIO]
+
+
+class PdfObject:
+    """
+    a pdf given as a path, or already in memory as bytes, a memoryview or a
+    file object (e.g. an object storage download or a zip member)
+    the content is held in one buffer, a read-only mmap for files on disk,
+    that every extraction step reads from
+    given another PdfObject (e.g. the one its layout was detected from), its
+    buffer, decrypted reader and page texts are taken over, not reopened
+    """
+
+    backend_name: str = ""
+
+    def __init__(
+        self,
+        filepath: Union[PdfSource, "PdfObject"],
+        backend: Optional[backends.TabulaBackend] = None,
+        passwords: Optional[tuple[str, ...]] = None,
+        name: str = "",
+    ) -> None:
+        self._data: Union[bytes, memoryview, mmap.mmap, None] = None
+        self._backend = backend
+        self.passwords = passwords  # None: PASSWORD / PASSWORD_FILE from .env
+        self._reader: Optional[PdfReader] = None
+        self._password = ""
+        self._page_texts: dict[int, str] = {}
+        self._decrypted: Optional[bytes] = None
+        if isinstance(filepath, PdfObject):
+            self._take_over(filepath)
+            return
+        if isinstance(filepath, (str, Path)):
+            filepath = Path(filepath)
+            if not filepath.is_file():
+                raise FileNotFoundError(f"{filepath=}")
+            self.in_memory = False
+        else:
+            if not isinstance(filepath, (bytes, memoryview)):
+                name = name or getattr(filepath, "name", "")
+                filepath = filepath.read()
+            self._data = filepath
+            filepath = Path(name or "<memory>.pdf")
+            self.in_memory = True
+        self.filepath = filepath  # name used in logs and results
+
+    def _take_over(self, other: "PdfObject") -> None:
+        self.filepath, self.in_memory, self._data = (
+            other.filepath,
+            other.in_memory,
+            other._data,
+        )
+        if self.passwords is None:
+            self.passwords = other.passwords
+        self._reader, self._password = other._reader, other._password
+        self._page_texts = other._page_texts
+        self._decrypted = other._decrypted
+
+    @property
+    def backend(self) -> backends.TabulaBackend:
+        """
+        the extraction backend, created on first use (not just to read text)
+        """
+        if self._backend is None:
+            self._backend = backends.get_backend(self.backend_name)
+        return self._backend
+
+    @property
+    def data(self) -> Union[bytes, memoryview, mmap.mmap]:
+        """
+        the whole pdf, a file on disk is mapped (not read) on first use
+        """
+        if self._data is None:
+            with open(self.filepath, "rb") as f:
+                try:
+                    self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:  # empty file, mmap refuses length 0
+                    self._data = f.read()
+        return self._data
+
+    def stream(self) -> BinaryIO:
+        """
+        a file object over data (the mmap itself, or a BytesIO sharing the bytes)
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.seek(0)
+            return self.data  # type: ignore
+        return io.BytesIO(self.data)
+
+    @property
+    def reader(self) -> PdfReader:
+        """
+        opened (and decrypted) on first use and reused afterwards
+        """
+        if self._reader is None:
+            with instrument.stage("pdf_open"):
+                # the stream is an mmap or a BytesIO, the error names the file
+                self._reader, self._password = decrypt.open_pdf(
+                    self.stream(), self.passwords, name=str(self.filepath)
+                )
+        return self._reader
+
+    @property
+    def encrypted(self) -> bool:
+        """
+        the file is only opened here when there are passwords to try
+        """
+        passwords = self.passwords
+        if passwords is None:
+            passwords = decrypt.get_passwords()
+        if self._reader is None and not passwords:
+            return False
+        return self.reader.is_encrypted
+
+    @property
+    def raw_text(self) -> str:
+        return self.read_pdf()
+
+    def page_text(self, index: int = 0) -> str:
+        if index not in self._page_texts:
+            page = self.reader.pages[index]
+            with instrument.stage("text"):
+                self._page_texts[index] = page.extract_text()
+        return self._page_texts[index]
+
+    def read_pdf(self, first_page_only: bool = False) -> str:
+        """
+        text of every page (or page 1 only), each page extracted at most once
+        """
+        n_pages = 1 if first_page_only else len(self.reader.pages)
+        return "\n\n".join(self.page_text(i) for i in range(n_pages))
+
+    def get_tables(
+        self,
+        areas: dict[str, list[float]],
+        headers: Optional[dict[str, int]] = None,
+    ) -> dict[str, pd.DataFrame]:
+        return self.backend.extract(self.source, areas, headers)
+
+    @property
+    def source(self):
+        """
+        what the extraction backend reads: the pypdf reader, or for tabula the
+        file path (tabula-java opens files itself, an in-memory pdf goes as a
+        file object that tabula-py hands over through a temp file)
+        an encrypted pdf goes to tabula decrypted, never with its password
+        """
+        if self.backend.needs_reader:
+            return self.reader
+        if self.encrypted:
+            if self._decrypted is None:
+                with instrument.stage("decrypt"):
+                    self._decrypted = decrypt.decrypted_copy(self.reader)
+            return io.BytesIO(self._decrypted)
+        return self.stream() if self.in_memory else self.filepath
+
+    def get_paytable(self, area: list[float]) -> pd.DataFrame:
+        return self.backend.read_area(self.source, area)
+
+    def get_deductions_table(self, area: list[float]) -> pd.DataFrame:
+        return self.backend.read_area(self.source, area)
+
+    def get_pay_summary_table(
+        self, area: list[float], pandas_options: dict = {"header": None}
+    ) -> pd.DataFrame:
+        return self.backend.read_area(
+            self.source, area, header=pandas_options.get("header")
+        )
+
+    def get_pay(self):
+        descr_index_start = self.raw_text.find("DESCRIPTION")
+        descr_index_end = self.raw_text[descr_index_start:].find("\n\n")
+        if descr_index_end == -1:
+            descr_index_end = self.raw_text[descr_index_start:].find("\n \n")
+        if descr_index_end != -1:
+            descr_index_end += descr_index_start
+
+        pay_text = self.raw_text[descr_index_start:descr_index_end]
+        # print(f"{self.raw_text[descr_index_start:]=}")
+        print(f"{descr_index_start=}, {descr_index_end=}")
+        print(f"{pay_text}")
+
+        pay_numbers = []
+        for line in pay_text.splitlines():
+            try:
+                pay_numbers.append(float(line.replace(",", "")))
+            except ValueError:
+                pass
+        print(f"{pay_numbers=}")
+        number_of_pay_items = len(pay_numbers) - 1
+
+        pay_headers = []
+        print("\n\n")
+
+    def save_to_textfile(self, txtstr: str, filepath: Path) -> None:
+        with open(filepath, "w") as writer:
+            writer.write(txtstr)
+        lg.info("saved to %s", filepath.name)
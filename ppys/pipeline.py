@@ -0,0 +1,240 @@
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+import utils
+import batch
+import instrument
+from cache import PayslipCache, layout_hash
+from records import PayslipRecord
+from sinks import Sink
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+
+@dataclass
+class Item:
+    filepath: Path
+    data: Optional[bytes] = None  # in-memory pdf, e.g. an archive member
+    payslip_cls: Optional[type] = None
+    content_hash: str = ""
+    payslip: Optional[object] = None
+    tables: Optional[dict] = None
+    record: Optional[PayslipRecord] = None
+    cached: bool = False
+    error: str = ""
+    stats: Optional[instrument.FileStats] = None
+
+
+@dataclass
+class PipelineStats:
+    written: int = 0
+    cached: int = 0
+    skipped: int = 0
+    failures: list[tuple[Path, str]] = field(default_factory=list)
+    files: list[instrument.FileStats] = field(default_factory=list)
+
+
+def discover(
+    filepaths: Iterable[Union[Path, tuple[Path, bytes]]],
+    skip: set[str],
+    stats: PipelineStats,
+) -> Iterator[Item]:
+    for source in filepaths:
+        fp, data = batch.split_source(source)
+        if str(fp) in skip:
+            stats.skipped += 1
+            continue
+        yield Item(fp, data)
+
+
+def classify(
+    items: Iterable[Item],
+    layouts: list[type],
+    cache: Optional[PayslipCache] = None,
+    backend_name: str = "",
+) -> Iterator[Item]:
+    """
+    take the layout and record of each file from cache when present, other
+    files are classified in extract, from the pdf opened to parse them
+    """
+    for item in items:
+        with instrument.timed_file(item.filepath) as item.stats:
+            _classify_one(item, layouts, cache, backend_name)
+        yield item
+
+
+def _classify_one(
+    item: Item,
+    layouts: list[type],
+    cache: Optional[PayslipCache] = None,
+    backend_name: str = "",
+) -> None:
+    if cache is None:
+        return
+    try:
+        with instrument.stage("hash"):
+            item.content_hash = batch.source_hash(item.filepath, item.data)
+    except Exception as e:
+        item.error = repr(batch.redact(e))
+        return
+    item.payslip_cls = batch.cached_layout(layouts, cache, item.content_hash)
+    if item.payslip_cls is not None:
+        name = backend_name or item.payslip_cls.backend_name
+        entry = cache.get(item.content_hash, layout_hash(item.payslip_cls, name))
+        if entry is not None and entry.row is not None:
+            item.record = entry.row
+            item.cached = True
+    else:
+        cache.misses += 1  # never classified, so never parsed either
+
+
+def extract(
+    items: Iterable[Item], layouts: list[type], backend_name: str = ""
+) -> Iterator[Item]:
+    for item in items:
+        if not item.error and item.record is None:
+            with instrument.timed_file(item.filepath, item.stats):
+                try:
+                    ps = batch.open_payslip(
+                        item.payslip_cls or layouts,
+                        item.filepath,
+                        backend_name,
+                        item.data,
+                    )
+                    if ps is None:
+                        item.error = "unknown payslip layout"
+                    else:
+                        item.payslip_cls = type(ps)
+                        item.tables = ps.get_layout_tables()
+                        item.payslip = ps
+                except Exception as e:
+                    item.error = repr(batch.redact(e))
+        yield item
+
+
+def crunch(items: Iterable[Item]) -> Iterator[Item]:
+    for item in items:
+        if not item.error and item.record is None:
+            with instrument.timed_file(item.filepath, item.stats):
+                try:
+                    with instrument.stage("parse"):
+                        item.payslip.parse()
+                    with instrument.stage("crunch"):
+                        item.record = item.payslip.crunch()
+                except Exception as e:
+                    item.error = repr(batch.redact(e))
+            item.payslip = None
+        yield item
+
+
+def extract_and_crunch_parallel(
+    items: Iterable[Item],
+    layouts: list[type],
+    workers: int,
+    backend_name: str = "",
+    worker_log_level: int = logging.INFO,
+) -> Iterator[Item]:
+    """
+    extract + crunch in a process pool, a bounded window of files in flight
+    items come out in the order they went in
+    """
+    window: deque = deque()
+    with utils.worker_log_queue() as log_queue, ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=batch.init_worker,
+        initargs=(backend_name, log_queue, worker_log_level),
+    ) as pool:
+        for item in items:
+            future = None
+            if not item.error and item.record is None:
+                future = pool.submit(
+                    batch.parse_one,
+                    item.payslip_cls or layouts,
+                    item.filepath,
+                    "",
+                    item.data,
+                )
+                item.data = None
+            window.append((item, future))
+            while len(window) > 4 * workers:
+                yield _collect(*window.popleft())
+        while window:
+            yield _collect(*window.popleft())
+
+
+def _collect(item: Item, future) -> Item:
+    if future is not None:
+        outcome = future.result()
+        item.record, item.tables, item.error = outcome.row, outcome.tables, ""
+        item.payslip_cls = outcome.payslip_cls or item.payslip_cls
+        if item.stats is not None:
+            item.stats.merge(outcome.stats)
+        if outcome.row is None:
+            item.error = outcome.error.splitlines()[0]
+    return item
+
+
+def run_pipeline(
+    filepaths: Iterable[Union[Path, tuple[Path, bytes]]],
+    layouts: list[type],
+    sink: Sink,
+    cache: Optional[PayslipCache] = None,
+    backend_name: str = "",
+    workers: int = 1,
+    resume: bool = True,
+    worker_log_level: int = logging.INFO,
+) -> PipelineStats:
+    """
+    discover -> classify -> extract -> crunch -> sink, one file at a time
+    files already committed to sink are skipped when resume is set
+    """
+    stats = PipelineStats()
+    skip = sink.committed() if resume else set()
+    items = discover(filepaths, skip, stats)
+    items = classify(items, layouts, cache, backend_name)
+    if workers > 1:
+        items = extract_and_crunch_parallel(
+            items, layouts, workers, backend_name, worker_log_level
+        )
+    else:
+        items = crunch(extract(items, layouts, backend_name))
+
+    for item in items:
+        if item.stats is not None:
+            stats.files.append(item.stats)
+        if item.error:
+            lg.warning("failed to parse %s: %s", item.filepath.name, item.error)
+            stats.failures.append((item.filepath, item.error))
+            continue
+        sink.write(str(item.filepath), item.record)
+        stats.written += 1
+        if item.cached:
+            stats.cached += 1
+        elif cache is not None:
+            name = backend_name or item.payslip_cls.backend_name
+            cache.put_layout(item.content_hash, item.payslip_cls.__name__)
+            cache.put(
+                item.content_hash,
+                layout_hash(item.payslip_cls, name),
+                item.tables,
+                item.record,
+            )
+        if cache is not None and stats.written % sink.flush_every == 0:
+            cache.commit()
+    sink.flush()
+    if cache is not None:
+        cache.commit()
+    lg.info(
+        "pipeline done: %d written (%d from cache), %d already committed, %d failed",
+        stats.written,
+        stats.cached,
+        stats.skipped,
+        len(stats.failures),
+    )
+    return stats
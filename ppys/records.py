@@ -0,0 +1,95 @@
+import datetime
+from dataclasses import asdict, dataclass, fields
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+import amounts
+
+
+@dataclass(slots=True)
+class PayslipRecord:
+    """
+    the crunched fields of one payslip, amounts in int cents
+    """
+
+    date: datetime.datetime
+    accounting_pay: int = 0
+    actual_net_pay: int = 0
+    basic_pay: int = 0
+    bonus_pay: int = 0
+    aws_pay: int = 0
+    deductable_cpf: int = 0
+    deductable_cdc: int = 0
+    deductable_pay: int = 0
+    cpf_employee: int = 0
+    cpf_employer: int = 0
+    allowances_pckg: int = 0
+    allowances_work: int = 0
+
+    def decimal(self, name: str) -> Decimal:
+        return amounts.cents_to_decimal(getattr(self, name))
+
+    def to_dict(self) -> dict:
+        res = asdict(self)
+        res["date"] = self.date.isoformat()
+        return res
+
+    @classmethod
+    def from_dict(cls, raw: dict) -> "PayslipRecord":
+        raw = dict(raw)
+        raw["date"] = datetime.datetime.fromisoformat(raw["date"])
+        return cls(**raw)
+
+
+FIELDS = [f.name for f in fields(PayslipRecord) if f.name != "date"]
+
+
+class RecordAccumulator:
+    """
+    appends PayslipRecords into preallocated typed columns (grown by doubling)
+    and builds the output DataFrame once at the end
+    an optional source (file name) per record becomes the "source" column
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.size = 0
+        self.sources: list[str] = []
+        self.dates = np.empty(capacity, dtype="datetime64[s]")
+        self.columns = {name: np.empty(capacity, dtype=np.int64) for name in FIELDS}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self) -> None:
+        capacity = max(1, 2 * len(self.dates))
+        self.dates = np.resize(self.dates, capacity)
+        for name, column in self.columns.items():
+            self.columns[name] = np.resize(column, capacity)
+
+    def append(self, record: PayslipRecord, source: str = "") -> None:
+        if self.size == len(self.dates):
+            self._grow()
+        i = self.size
+        self.sources.append(source)
+        self.dates[i] = np.datetime64(record.date, "s")
+        for name, column in self.columns.items():
+            column[i] = getattr(record, name)
+        self.size += 1
+
+    def extend(self, records) -> None:
+        for record in records:
+            self.append(record)
+
+    def to_frame(self, cents: bool = False) -> pd.DataFrame:
+        """
+        amounts as float64 dollars, or as exact int64 cents with cents=True
+        """
+        n = self.size
+        data = {}
+        if any(self.sources):
+            data["source"] = self.sources
+        for name, column in self.columns.items():
+            data[name] = column[:n] if cents else column[:n] / 100
+        return pd.DataFrame(data, index=pd.DatetimeIndex(self.dates[:n], name="date"))
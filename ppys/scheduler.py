@@ -0,0 +1,517 @@
+import json
+import logging
+import multiprocessing as mp
+import os
+import sqlite3
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+import numpy as np
+
+import utils
+import batch
+import instrument
+from batch import BatchResult, ParseOutcome
+from cache import PayslipCache, layout_hash
+from records import PayslipRecord
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+QUARANTINE_FILENAME = ".ppys_quarantine.sqlite"
+STAGE_SECONDS = {
+    "detect": 20.0,
+    "pdf_open": 20.0,
+    "text": 20.0,
+    "extract": 60.0,
+    "parse": 30.0,
+    "crunch": 10.0,
+}
+# failures that may pass on a second try (load, a slow disk); anything else,
+# e.g. a KeyError in get_pay_date, fails the same way again
+RETRYABLE = {"BudgetExceeded", "MemoryError", "Timeout", "WorkerDied"}
+# fixed by configuration (PASSWORD, a new layout) rather than by editing the
+# file, so reported but not quarantined: the next run tries them again
+NOT_QUARANTINED = {"UnknownLayout", "WrongPassword"}
+POLL_SECONDS = 0.5
+
+
+class Quarantine:
+    """
+    sqlite list of payslips that failed for good, skipped by later runs
+    until their content changes or they are released
+    """
+
+    def __init__(self, filepath: Path) -> None:
+        self.filepath = filepath
+        self.conn = sqlite3.connect(filepath)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quarantine (
+                path TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                error_type TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                quarantined_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def holds(self, filepath: Path, data: Optional[bytes] = None) -> bool:
+        """
+        quarantined, and not changed since; only listed files are hashed
+        """
+        res = self.conn.execute(
+            "SELECT content_hash FROM quarantine WHERE path=?", (str(filepath),)
+        ).fetchone()
+        return res is not None and res[0] == batch.source_hash(filepath, data)
+
+    def add(
+        self,
+        filepath: Path,
+        data: Optional[bytes],
+        error_type: str,
+        reason: str,
+        attempts: int,
+    ) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO quarantine VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                str(filepath),
+                batch.source_hash(filepath, data),
+                error_type,
+                reason,
+                attempts,
+                time.time(),
+            ),
+        )
+        self.conn.commit()
+
+    def release(self, paths: Optional[Iterable[str]] = None) -> int:
+        """
+        let the given paths (default: all) be tried again, returns how many
+        """
+        n = self.conn.total_changes
+        if paths is None:
+            self.conn.execute("DELETE FROM quarantine")
+        else:
+            self.conn.executemany(
+                "DELETE FROM quarantine WHERE path=?", [(x,) for x in paths]
+            )
+        self.conn.commit()
+        return self.conn.total_changes - n
+
+    def entries(self) -> list[tuple]:
+        return self.conn.execute(
+            "SELECT path, error_type, reason, attempts FROM quarantine ORDER BY path"
+        ).fetchall()
+
+
+@dataclass
+class ScheduleReport:
+    files: int = 0
+    parsed: int = 0
+    cached: int = 0  # of parsed, answered from the PayslipCache
+    skipped: int = 0  # quarantined by an earlier run
+    retries: int = 0
+    timeouts: int = 0
+    killed_rss: int = 0
+    worker_restarts: int = 0
+    quarantined: list[tuple[str, str, str]] = field(default_factory=list)
+    latencies: list[float] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def percentiles(self) -> dict[str, float]:
+        """
+        seconds per parse attempt, as seen by the scheduler
+        """
+        if not self.latencies:
+            return {}
+        values = np.array(self.latencies)
+        return {
+            "p50": round(float(np.median(values)), 3),
+            "p95": round(float(np.percentile(values, 95)), 3),
+            "max": round(float(values.max()), 3),
+        }
+
+    def to_dict(self) -> dict:
+        res = asdict(self)
+        res["latencies"] = self.percentiles()
+        return res
+
+    def write(self, filepath: Path) -> None:
+        with open(filepath, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.parsed}/{self.files} parsed in {self.elapsed:.1f}s "
+            f"({self.cached} cached), "
+            f"{len(self.quarantined)} quarantined, {self.skipped} skipped, "
+            f"{self.retries} retries, {self.timeouts} timeouts, "
+            f"{self.killed_rss} killed over memory, "
+            f"{self.worker_restarts} worker restarts",
+            f"seconds per attempt: {self.percentiles()}",
+        ]
+        lines += [
+            f"  quarantined {source}: {error_type} {reason}"
+            for source, error_type, reason in self.quarantined
+        ]
+        return "\n".join(lines)
+
+
+@dataclass
+class _Task:
+    filepath: Path
+    data: Optional[bytes] = None
+    attempts: int = 0
+    content_hash: str = ""  # set when there is a cache to store the result in
+
+
+def _attempt(
+    filepath: Path,
+    data: Optional[bytes],
+    layouts: list[type],
+    backend_name: str,
+    limits: instrument.Budgets,
+    keep_tables: bool = False,
+) -> ParseOutcome:
+    """
+    detect, parse and crunch one payslip under limits, in a worker
+    """
+    with instrument.budgets(limits):
+        # detected from the pdf it parses, an encrypted file is decrypted once
+        outcome = batch.parse_one(layouts, filepath, backend_name, data)
+    if not keep_tables:
+        outcome.tables = None  # only the parent's cache needs them, spare the pipe
+    return outcome
+
+
+def _worker_main(
+    conn,
+    layouts: list[type],
+    backend_name: str,
+    limits: instrument.Budgets,
+    keep_tables: bool,
+    log_queue,
+    log_level: int,
+) -> None:
+    batch.init_worker(backend_name, log_queue, log_level)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        conn.send(_attempt(*task, layouts, backend_name, limits, keep_tables))
+
+
+class _Worker:
+    """
+    one worker process fed a payslip at a time over a pipe, so a hung or
+    runaway parse can be killed without losing the others
+    """
+
+    def __init__(self, ctx, args: tuple) -> None:
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, *args))
+        self.process.start()
+        child_conn.close()
+        self.task: Optional[_Task] = None
+        self.started = 0.0
+
+    def submit(self, task: _Task) -> None:
+        self.task = task
+        self.started = time.monotonic()
+        self.conn.send((task.filepath, task.data))
+
+    def rss_mb(self) -> float:
+        return instrument.rss_mb(self.process.pid)
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class Scheduler:
+    """
+    parses payslips in worker processes, one file at a time per worker, with
+    - file_timeout: seconds per attempt, the worker is killed and replaced
+    - stage_seconds: per-stage budgets, raised inside the worker (SIGALRM)
+    - rss_mb: memory budget checked after each stage; a worker above twice
+      that is killed
+    - retries: further attempts for RETRYABLE failures, queued behind the
+      remaining files so good files are not held up
+    files are taken from filepaths as workers free up, so parsing starts while
+    discovery is still going; given a PayslipCache, files already parsed are
+    answered from it and new results are added to it
+    files that still fail are reported and, given a Quarantine, recorded there
+    and skipped by later runs until they change (NOT_QUARANTINED failures are
+    only reported)
+    """
+
+    def __init__(
+        self,
+        layouts: list[type],
+        backend_name: str = "",
+        workers: int = 1,
+        file_timeout: float = 120.0,
+        stage_seconds: Optional[dict[str, float]] = None,
+        rss_mb: float = 2048.0,
+        retries: int = 1,
+        quarantine: Optional[Quarantine] = None,
+        cache: Optional[PayslipCache] = None,
+        worker_log_level: int = logging.INFO,
+    ) -> None:
+        self.layouts = layouts
+        self.backend_name = backend_name
+        self.workers = workers if workers > 0 else os.cpu_count() or 1
+        self.file_timeout = file_timeout
+        self.limits = instrument.Budgets(
+            STAGE_SECONDS if stage_seconds is None else stage_seconds, rss_mb
+        )
+        self.retries = retries
+        self.quarantine = quarantine
+        self.cache = cache
+        self.worker_log_level = worker_log_level
+        self.report = ScheduleReport()
+
+    def _start_worker(self, log_queue) -> _Worker:
+        args = (
+            self.layouts,
+            self.backend_name,
+            self.limits,
+            self.cache is not None,
+            log_queue,
+            self.worker_log_level,
+        )
+        return _Worker(mp.get_context(), args)
+
+    def _tasks(
+        self,
+        filepaths: Iterable[Union[Path, tuple[Path, bytes]]],
+        result: BatchResult,
+        rows: list,
+    ) -> Iterator[_Task]:
+        """
+        the payslips to parse, one at a time as filepaths yields them
+        quarantined files are skipped, cached ones go straight to result
+        """
+        for item in filepaths:
+            fp, data = batch.split_source(item)
+            self.report.files += 1
+            if self.quarantine is not None and self.quarantine.holds(fp, data):
+                self.report.skipped += 1
+                lg.info("skipping quarantined %s", fp.name)
+                continue
+            task = _Task(fp, data)
+            row = self._cached(task)
+            if row is not None:
+                self.report.parsed += 1
+                self.report.cached += 1
+                rows.append((fp, row))
+                result.parsed.append(fp)
+                continue
+            yield task
+
+    def _cached(self, task: _Task) -> Optional[PayslipRecord]:
+        """
+        the row cached for task, None if not there (or no cache)
+        """
+        if self.cache is None:
+            return None
+        try:
+            task.content_hash = batch.source_hash(task.filepath, task.data)
+        except OSError as e:
+            # the worker reports it when it fails to open the file too
+            lg.warning("cannot hash %s: %r", task.filepath.name, e)
+            return None
+        cls = batch.cached_layout(self.layouts, self.cache, task.content_hash)
+        if cls is None:
+            self.cache.misses += 1  # never classified, so never parsed either
+            return None
+        entry = self.cache.get(
+            task.content_hash, layout_hash(cls, self.backend_name or cls.backend_name)
+        )
+        return entry.row if entry is not None else None
+
+    def _store(self, task: _Task, outcome: ParseOutcome) -> None:
+        if self.cache is None or not task.content_hash or outcome.tables is None:
+            return
+        cls = outcome.payslip_cls
+        self.cache.put_layout(task.content_hash, cls.__name__)
+        self.cache.put(
+            task.content_hash,
+            layout_hash(cls, self.backend_name or cls.backend_name),
+            outcome.tables,
+            outcome.row,
+        )
+
+    @staticmethod
+    def _next(tasks: Iterator[_Task], retry: deque[_Task]) -> Optional[_Task]:
+        """
+        the next new file, retries once discovery is done
+        """
+        task = next(tasks, None)
+        if task is None and retry:
+            task = retry.popleft()
+        return task
+
+    def _check(self, worker: _Worker, now: float) -> Optional[ParseOutcome]:
+        """
+        a failed outcome if the busy worker ran out of time or memory
+        """
+        fp = worker.task.filepath
+        if now - worker.started > self.file_timeout:
+            self.report.timeouts += 1
+            return ParseOutcome(
+                fp,
+                error=f"no result after {self.file_timeout}s",
+                error_type="Timeout",
+            )
+        if self.limits.rss_mb and (rss := worker.rss_mb()) > 2 * self.limits.rss_mb:
+            self.report.killed_rss += 1
+            return ParseOutcome(
+                fp, error=f"worker rss {rss:.0f} MiB", error_type="MemoryError"
+            )
+        return None
+
+    def _done(
+        self,
+        task: _Task,
+        outcome: ParseOutcome,
+        seconds: float,
+        retry: deque[_Task],
+        result: BatchResult,
+        rows: list,
+    ) -> None:
+        task.attempts += 1
+        self.report.latencies.append(seconds)
+        if outcome.stats is not None:
+            result.stats.append(outcome.stats)
+        if outcome.row is not None:
+            self.report.parsed += 1
+            rows.append((task.filepath, outcome.row))
+            result.parsed.append(task.filepath)
+            self._store(task, outcome)
+            return
+        reason = outcome.error.splitlines()[0] if outcome.error else ""
+        if outcome.error_type in RETRYABLE and task.attempts <= self.retries:
+            self.report.retries += 1
+            lg.warning("retrying %s after %s", task.filepath.name, reason)
+            retry.append(task)
+            return
+        result.failures.append((task.filepath, outcome.error))
+        if outcome.error_type in NOT_QUARANTINED:
+            lg.warning("failed to parse %s: %s", task.filepath.name, reason)
+            return
+        lg.warning("quarantined %s: %s", task.filepath.name, reason)
+        self.report.quarantined.append((str(task.filepath), outcome.error_type, reason))
+        if self.quarantine is not None:
+            self.quarantine.add(
+                task.filepath, task.data, outcome.error_type, reason, task.attempts
+            )
+
+    def run(self, filepaths: Iterable[Union[Path, tuple[Path, bytes]]]) -> BatchResult:
+        """
+        parse every payslip once it is through, bad ones end up in
+        BatchResult.failures; counters and latencies are in self.report
+        """
+        t0 = time.perf_counter()
+        self.report = ScheduleReport()
+        result = BatchResult(data=batch.merge_results([]))
+        rows: list = []
+        tasks = self._tasks(filepaths, result, rows)
+        retry: deque[_Task] = deque()
+        with utils.worker_log_queue() as log_queue:
+            # started as there is work for them, none if all files are cached
+            workers: list[_Worker] = []
+            try:
+                while True:
+                    for w in workers:
+                        if w.task is None and (task := self._next(tasks, retry)):
+                            w.submit(task)
+                    while len(workers) < self.workers and (
+                        task := self._next(tasks, retry)
+                    ):
+                        workers.append(self._start_worker(log_queue))
+                        workers[-1].submit(task)
+                    busy = [w for w in workers if w.task is not None]
+                    if not busy:
+                        break
+                    now = time.monotonic()
+                    timeout = min(w.started + self.file_timeout for w in busy) - now
+                    ready = wait(
+                        [w.conn for w in busy], max(0.0, min(timeout, POLL_SECONDS))
+                    )
+                    now = time.monotonic()
+                    for i, w in enumerate(workers):
+                        if w.task is None:
+                            continue
+                        restart = False
+                        if w.conn in ready:
+                            try:
+                                outcome = w.conn.recv()
+                            except (EOFError, OSError):
+                                outcome = ParseOutcome(
+                                    w.task.filepath,
+                                    error=f"worker exit code {w.process.exitcode}",
+                                    error_type="WorkerDied",
+                                )
+                                restart = True
+                            else:
+                                # memory a budget overrun left behind stays
+                                restart = outcome.error_type == "BudgetExceeded"
+                        else:
+                            outcome = self._check(w, now)
+                            if outcome is None:
+                                continue
+                            restart = True
+                        task, w.task = w.task, None
+                        if restart:
+                            w.kill()
+                            self.report.worker_restarts += 1
+                            workers[i] = self._start_worker(log_queue)
+                        self._done(task, outcome, now - w.started, retry, result, rows)
+            finally:
+                for w in workers:
+                    if w.task is None:
+                        w.stop()
+                    else:
+                        w.kill()
+        if self.cache is not None:
+            self.cache.commit()
+        result.data = batch.merge_results(rows)
+        self.report.elapsed = time.perf_counter() - t0
+        lg.info("schedule done: %s", self.report)
+        return result
@@ -0,0 +1,358 @@
+import asyncio
+import http.client
+import json
+import logging
+import socket
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import utils
+import backends
+import batch
+from main import LAYOUTS
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+DEFAULT_PORT = 8750
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    503: "Service Unavailable",
+}
+
+
+class Busy(Exception):
+    """
+    the queue of pending payslips is full, the client should retry later
+    """
+
+
+@dataclass
+class ServiceStats:
+    requests: int = 0
+    parsed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    batches: int = 0
+    largest_batch: int = 0
+
+
+@dataclass
+class _Job:
+    name: str
+    data: bytes
+    future: asyncio.Future = field(repr=False)
+
+
+def _warm_up(backend_name: str) -> None:
+    backends.get_backend(backend_name)
+
+
+def parse_batch(items: list[tuple[str, bytes]], backend_name: str = "") -> list[dict]:
+    """
+    classify, parse and crunch in-memory payslips, one json-ready dict each
+    with either "record" (amounts in int cents) or "error"
+    runs in a worker, so one call per batch instead of one per payslip
+    """
+    results = []
+    for name, data in items:
+        filepath = Path(name)
+        res: dict = {"source": name}
+        outcome = batch.parse_one(LAYOUTS, filepath, backend_name, data)
+        if outcome.payslip_cls is not None:
+            res["layout"] = outcome.payslip_cls.__name__
+        res["ms"] = round(1000 * outcome.stats.total, 1) if outcome.stats else None
+        if outcome.row is None:
+            res["error"] = outcome.error.splitlines()[0]
+        else:
+            res["record"] = outcome.row.to_dict()
+        results.append(res)
+    return results
+
+
+class PayslipService:
+    """
+    long-running parser behind a local HTTP endpoint (tcp or unix socket)
+
+    POST /parse  body: one pdf, ?name=<file name> optional
+                 200 with the crunched fields, 422 if it cannot be parsed,
+                 503 + Retry-After when max_pending payslips are already queued
+    GET /health  counters and queue length
+
+    concurrent uploads are coalesced into batches of up to batch_size, waiting
+    at most batch_wait seconds for a batch to fill; at most 2 batches per
+    worker are in flight, the backends stay warm between batches
+    """
+
+    def __init__(
+        self,
+        backend_name: str = "",
+        workers: int = 1,
+        batch_size: int = 16,
+        batch_wait: float = 0.02,
+        max_pending: int = 256,
+        max_bytes: int = 20 * 2**20,
+        worker_log_level: int = logging.INFO,
+    ) -> None:
+        self.backend_name = backend_name
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_bytes = max_bytes
+        self.worker_log_level = worker_log_level
+        self.stats = ServiceStats()
+        self.queue: asyncio.Queue[_Job] = asyncio.Queue(maxsize=max_pending)
+        self.slots = asyncio.Semaphore(2 * self.workers)
+        self.pool: Optional[Executor] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._exit_stack = ExitStack()
+        self._tasks: set[asyncio.Task] = set()
+
+    def _start_pool(self) -> Executor:
+        if self.workers == 1:
+            # one thread keeps the backend (and a JVM) warm in this process
+            return ThreadPoolExecutor(max_workers=1, thread_name_prefix=APP_NAME)
+        log_queue = self._exit_stack.enter_context(utils.worker_log_queue())
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=batch.init_worker,
+            initargs=(self.backend_name, log_queue, self.worker_log_level),
+        )
+
+    async def start(
+        self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, path: str = ""
+    ) -> asyncio.AbstractServer:
+        """
+        start the workers and listen on host:port, or on the unix socket path
+        port 0 picks a free port, see self.address
+        """
+        loop = asyncio.get_running_loop()
+        self.pool = self._start_pool()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(self.pool, _warm_up, self.backend_name)
+                for _ in range(self.workers)
+            )
+        )
+        self._spawn(self._batcher())
+        if path:
+            self.server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port)
+        lg.info(
+            "serving on %s, workers=%d batch_size=%d",
+            self.address,
+            self.workers,
+            self.batch_size,
+        )
+        return self.server
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname() if self.server else None
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        while not self.queue.empty():
+            self.queue.get_nowait().future.cancel()
+        if self.pool is not None:
+            await asyncio.to_thread(self.pool.shutdown)
+        self._exit_stack.close()
+        lg.info("service stopped: %s", self.stats)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def submit(self, name: str, data: bytes) -> dict:
+        """
+        queue one pdf and wait for its result, raises Busy if the queue is full
+        """
+        job = _Job(name, data, asyncio.get_running_loop().create_future())
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats.rejected += 1
+            raise Busy(f"{self.queue.qsize()} payslips pending") from None
+        return await job.future
+
+    async def _batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self.queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(jobs) < self.batch_size:
+                if not self.queue.empty():
+                    jobs.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    jobs.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # no free worker: stop taking jobs, the queue fills up and rejects
+            await self.slots.acquire()
+            self._spawn(self._run_batch(jobs))
+
+    async def _run_batch(self, jobs: list[_Job]) -> None:
+        self.stats.batches += 1
+        self.stats.largest_batch = max(self.stats.largest_batch, len(jobs))
+        items = [(job.name, job.data) for job in jobs]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.pool, parse_batch, items, self.backend_name
+            )
+        except Exception as e:
+            lg.error("batch of %d failed: %r", len(jobs), batch.redact(e))
+            error = repr(batch.redact(e))
+            results = [{"source": job.name, "error": error} for job in jobs]
+        finally:
+            self.slots.release()
+        for job, res in zip(jobs, results):
+            if "error" in res:
+                self.stats.failed += 1
+            else:
+                self.stats.parsed += 1
+            if not job.future.done():
+                job.future.set_result(res)
+
+    async def _respond(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> tuple[int, dict]:
+        method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        if url.path == "/health":
+            return 200, asdict(self.stats) | {"pending": self.queue.qsize()}
+        if url.path != "/parse":
+            return 404, {"error": f"no such endpoint {url.path}"}
+        if method != "POST":
+            return 405, {"error": "POST a pdf to /parse"}
+        self.stats.requests += 1
+        length = int(headers.get("content-length", -1))
+        if length < 0:
+            return 411, {"error": "Content-Length required"}
+        if length > self.max_bytes:
+            return 413, {"error": f"pdf larger than {self.max_bytes} bytes"}
+        if self.queue.full():
+            # refuse before reading the body
+            self.stats.rejected += 1
+            return 503, {"error": "busy, retry later"}
+        if headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        data = await reader.readexactly(length)
+        name = parse_qs(url.query).get("name", [""])[0]
+        name = name or f"upload_{self.stats.requests}.pdf"
+        try:
+            res = await self.submit(name, data)
+        except Busy:
+            return 503, {"error": "busy, retry later"}
+        return (200 if "record" in res else 422), res
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            status, body = await self._respond(reader, writer)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, body = 400, {"error": f"bad request: {e!r}"}
+        except (ConnectionError, asyncio.CancelledError):
+            writer.close()
+            return
+        payload = json.dumps(body).encode()
+        head = (
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            + ("Retry-After: 1\r\n" if status == 503 else "")
+            + "Connection: close\r\n\r\n"
+        )
+        try:
+            writer.write(head.encode("latin-1") + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def serve(
+    host: str = "127.0.0.1", port: int = DEFAULT_PORT, path: str = "", **options
+) -> None:
+    """
+    run a PayslipService until interrupted, options as in PayslipService()
+    """
+
+    async def run() -> None:
+        service = PayslipService(**options)
+        server = await service.start(host, port, path)
+        try:
+            await server.serve_forever()
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def post_pdf(
+    data: bytes,
+    name: str = "",
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    path: str = "",
+    timeout: float = 60.0,
+) -> tuple[int, dict]:
+    """
+    client side: send one pdf to a running service, returns (status, json body)
+    """
+    if path:
+        conn = _UnixConnection(path, timeout)
+    else:
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request(
+            "POST",
+            "/parse?" + urlencode({"name": name}),
+            body=data,
+            headers={"Content-Type": "application/pdf"},
+        )
+        res = conn.getresponse()
+        return res.status, json.loads(res.read())
+    finally:
+        conn.close()
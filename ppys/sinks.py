@@ -0,0 +1,173 @@
+import csv
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+import utils
+from amounts import cents_to_decimal
+from records import FIELDS, PayslipRecord
+
+
+APP_NAME = "ppys"
+lg = utils.init_logger(APP_NAME)
+
+COLUMNS = ["source", "date"] + FIELDS
+
+
+class Sink:
+    """
+    append-only output for streamed records
+    buffered rows are committed every flush_every writes and on close()
+    committed() lists the sources already in the output, used to resume a run
+    """
+
+    def __init__(self, filepath: Path, flush_every: int = 100) -> None:
+        self.filepath = filepath
+        self.flush_every = flush_every
+        self.buffer: list[list] = []
+        self.n_committed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def committed(self) -> set[str]:
+        raise NotImplementedError
+
+    def write(self, source: str, record: PayslipRecord) -> None:
+        self.buffer.append(
+            [source, record.date.isoformat()] + [getattr(record, f) for f in FIELDS]
+        )
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.flush()
+
+    def read(self) -> pd.DataFrame:
+        """
+        everything committed so far, ordered by pay date
+        """
+        raise NotImplementedError
+
+
+class CsvSink(Sink):
+    def __init__(self, filepath: Path, flush_every: int = 100) -> None:
+        super().__init__(filepath, flush_every)
+        self._truncate_partial_line()
+
+    def _truncate_partial_line(self) -> None:
+        """
+        drop a half-written last row left behind by a crash
+        """
+        if not self.filepath.is_file():
+            return
+        with open(self.filepath, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+                lg.warning("dropped partial last row of %s", self.filepath.name)
+
+    def committed(self) -> set[str]:
+        if not self.filepath.is_file():
+            return set()
+        with open(self.filepath, newline="") as f:
+            return {row["source"] for row in csv.DictReader(f)}
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        new_file = not self.filepath.is_file() or self.filepath.stat().st_size == 0
+        with open(self.filepath, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(COLUMNS)
+            for row in self.buffer:
+                # amounts as exact 2-decimal strings instead of int cents
+                writer.writerow(row[:2] + [cents_to_decimal(x) for x in row[2:]])
+            f.flush()
+            os.fsync(f.fileno())
+        self.n_committed += len(self.buffer)
+        self.buffer = []
+
+    def read(self) -> pd.DataFrame:
+        df = pd.read_csv(self.filepath, parse_dates=["date"], index_col="date")
+        return df.sort_index(kind="stable")
+
+
+class SqliteSink(Sink):
+    """
+    amounts are stored as exact int cents
+    """
+
+    table = "records"
+
+    def __init__(self, filepath: Path, flush_every: int = 100) -> None:
+        super().__init__(filepath, flush_every)
+        self.conn = sqlite3.connect(filepath)
+        columns = ", ".join(f"{f} INTEGER NOT NULL" for f in FIELDS)
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS records "
+            f"(source TEXT PRIMARY KEY, date TEXT NOT NULL, {columns})"
+        )
+        self.conn.commit()
+
+    def committed(self) -> set[str]:
+        return {x[0] for x in self.conn.execute("SELECT source FROM records")}
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        placeholders = ", ".join("?" * len(COLUMNS))
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO records VALUES ({placeholders})", self.buffer
+        )
+        self.conn.commit()
+        self.n_committed += len(self.buffer)
+        self.buffer = []
+
+    def close(self) -> None:
+        super().close()
+        self.conn.close()
+
+    def read(self) -> pd.DataFrame:
+        with closing(sqlite3.connect(self.filepath)) as conn:
+            return read_records(conn)
+
+
+def read_records(conn: sqlite3.Connection) -> pd.DataFrame:
+    """
+    the records table of a SqliteSink output, amounts converted to dollars
+    like the frames of export.read_frame
+    """
+    df = pd.read_sql_query(
+        f"SELECT * FROM {SqliteSink.table} ORDER BY date, source",
+        conn,
+        parse_dates=["date"],
+        index_col="date",
+    )
+    df[FIELDS] = df[FIELDS] / 100
+    return df
+
+
+SINKS = {
+    ".csv": CsvSink,
+    ".sqlite": SqliteSink,
+    ".db": SqliteSink,
+}
+
+
+def get_sink(filepath: Path, flush_every: int = 100) -> Sink:
+    try:
+        sink_cls = SINKS[filepath.suffix.lower()]
+    except KeyError:
+        raise ValueError(f"no sink for {filepath.name}, choose from {list(SINKS)}")
+    return sink_cls(filepath, flush_every=flush_every)
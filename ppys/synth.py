@@ -0,0 +1,167 @@
+import datetime
+import random
+from pathlib import Path
+from typing import Iterator
+
+import mapping
+from main import FLEXHR_AREAS, SAP_AREAS
+
+
+PAGE_WIDTH = 595  # A4 in points
+PAGE_HEIGHT = 842
+FONT_SIZE = 8
+LINE_HEIGHT = 12
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(items: list[tuple[float, float, str]]) -> bytes:
+    """
+    a one page pdf with each (x, y, text) drawn in Helvetica, y from the bottom
+    """
+    content = "".join(
+        f"BT /F1 {FONT_SIZE} Tf 1 0 0 1 {x:.2f} {y:.2f} Tm ({_escape(t)}) Tj ET\n"
+        for x, y, t in items
+    ).encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>"
+        % (PAGE_WIDTH, PAGE_HEIGHT),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+        b"/Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"endstream",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(out)
+
+
+def _inside(area: list[float], pad: float = 6.0) -> tuple[float, float]:
+    """
+    top-left corner (x, baseline y) just inside a relative [top, left, bottom,
+    right] area box as used by the tabula areas
+    """
+    top, left = area[0], area[1]
+    return (
+        PAGE_WIDTH * left / 100 + pad,
+        PAGE_HEIGHT * (1 - top / 100) - pad - FONT_SIZE,
+    )
+
+
+def _rows(area, rows: list[tuple[str, str]], amount_dx: float) -> list:
+    x, y = _inside(area)
+    items = []
+    for i, (label, amount) in enumerate(rows):
+        items.append((x, y - i * LINE_HEIGHT, label))
+        if amount:
+            items.append((x + amount_dx, y - i * LINE_HEIGHT, amount))
+    return items
+
+
+def _money(cents: int) -> str:
+    return f"{cents / 100:,.2f}"
+
+
+def _optional_labels(layout: str, table: str) -> list[str]:
+    return list(mapping.get_mapping(layout, table).optional)
+
+
+def flexhr_payslip(month: datetime.date, rng: random.Random) -> bytes:
+    """
+    FlexHR layout: PERIOD box, pay table, deductions and CURRENT EARNING summary
+    """
+    basic = rng.randrange(300_000, 1_200_000, 100)
+    extras = rng.sample(_optional_labels("flexhr", "paytable"), rng.randint(0, 4))
+    pay = [("BASIC PAY", _money(basic))]
+    pay += [(label, _money(rng.randrange(2_000, 300_000, 5))) for label in extras]
+    cpf = min(basic, 600_000) * 20 // 100
+    cdac = rng.choice([100, 200, 300])
+    deductions = [
+        ("CPF CONTRIBUTION - EMPLOYEE", "-" + _money(cpf)),
+        ("CHINESE DEVELOPMENT ASSISTANC", "-" + _money(cdac)),
+        ("TOTAL DEDUCTIONS", "-" + _money(cpf + cdac)),
+    ]
+    summary = [
+        ("DESCRIPTION", "CURRENT EARNING"),
+        ("Employee CPF", _money(cpf)),
+        ("Employer CPF", _money(min(basic, 600_000) * 17 // 100)),
+    ]
+    items = _rows(
+        FLEXHR_AREAS["date"], [("PERIOD", ": " + month.strftime("%b-%Y"))], 60
+    )
+    items += _rows(FLEXHR_AREAS["paytable"], pay, 200)
+    items += _rows(FLEXHR_AREAS["deductions"], deductions, 200)
+    items += _rows(FLEXHR_AREAS["pay_summary"], summary, 150)
+    return make_pdf(items)
+
+
+def sap_payslip(month: datetime.date, rng: random.Random) -> bytes:
+    """
+    SAP layout: pay period line, pay table and CPF summary box
+    """
+    basic = rng.randrange(300_000, 1_200_000, 100)
+    extras = rng.sample(_optional_labels("sap", "paytable"), rng.randint(0, 4))
+    pay = [("Basic Salary", _money(basic))]
+    pay += [(label, _money(rng.randrange(2_000, 300_000, 5))) for label in extras]
+    pay += [("Fund - CDAC", "-" + _money(rng.choice([100, 200, 300])))]
+    cpf = min(basic, 600_000) * 20 // 100
+    summary = [
+        ("CPF Employee", _money(cpf)),
+        ("CPF Employer", _money(min(basic, 600_000) * 17 // 100)),
+    ]
+    first = month.replace(day=1)
+    last = (first + datetime.timedelta(days=32)).replace(day=1)
+    last -= datetime.timedelta(days=1)
+    period = f"{first:%d/%m/%Y} to {last:%d/%m/%Y}"
+    items = _rows(SAP_AREAS["date"], [(period, "")], 0)
+    items += _rows(SAP_AREAS["paytable"], pay, 150)
+    items += _rows(SAP_AREAS["pay_summary"], summary, 70)
+    return make_pdf(items)
+
+
+GENERATORS = {"flexhr": flexhr_payslip, "sap": sap_payslip}
+
+
+def iter_payslips(
+    n: int, layouts: tuple[str, ...] = ("flexhr", "sap"), seed: int = 0
+) -> Iterator[tuple[str, bytes]]:
+    """
+    n (file name, pdf bytes), layouts taking turns, one pay month per payslip
+    the same seed always gives the same files
+    """
+    rng = random.Random(seed)
+    start = datetime.date(2015, 1, 1)
+    for i in range(n):
+        layout = layouts[i % len(layouts)]
+        month = datetime.date(start.year + i // 12 % 50, i % 12 + 1, 1)
+        yield f"{layout}_{i:06d}.pdf", GENERATORS[layout](month, rng)
+
+
+def generate(
+    outdir: Path, n: int, layouts: tuple[str, ...] = ("flexhr", "sap"), seed: int = 0
+) -> list[Path]:
+    """
+    write n synthetic payslips into outdir
+    """
+    outdir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for name, data in iter_payslips(n, layouts, seed):
+        fp = outdir / name
+        fp.write_bytes(data)
+        paths.append(fp)
+    return paths
@@ -1,5 +1,11 @@
+import atexit
 import logging
+import multiprocessing
+import queue
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from typing import Iterator, Optional
 
 
 APP_NAME = "ppys"
@@ -61,10 +67,33 @@ class PathFinder:
         return fp
 
 
+_log_listeners: dict[str, QueueListener] = {}
+
+
+class _LocalQueueHandler(QueueHandler):
+    """
+    in-process queue: only the %-args are merged here (they may change after
+    the call), the formatters run on the listener thread
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _stop_listeners() -> None:
+    while _log_listeners:
+        _, listener = _log_listeners.popitem()
+        listener.stop()  # drains the queue first
+
+
 def init_logger(name: str = "") -> logging.Logger:
     """
     initialize an logger (console output and file output)
     returns existing logger if already initialized before
+    callers only enqueue records, a background QueueListener thread formats
+    and writes them (the queue is drained at exit)
     """
     logger_name = name if name else __name__
     logger = logging.getLogger(logger_name)
@@ -74,21 +103,80 @@ def init_logger(name: str = "") -> logging.Logger:
     c_format = logging.Formatter("%(levelname)-8s: %(message)s")
     c_handler.setFormatter(c_format)
     c_handler.setLevel(logging.INFO)
-    logger.addHandler(c_handler)
     logger_filename = (
         f"{logger_name}.log" if logger_name != "__main__" else f"{name}.log"
     )
-    f_handler = logging.FileHandler(logger_filename)
+    f_handler = logging.FileHandler(logger_filename, delay=True)  # on first record
     f_format = logging.Formatter(
         "[%(asctime)s]%(levelname)-8s: %(message)s", "%d-%b-%y %H:%M"
     )
     f_handler.setFormatter(f_format)
     f_handler.setLevel(logging.INFO)
-    logger.addHandler(f_handler)
-    logger.setLevel(logging.INFO)
-    logger.info(f"logger initialized - {logger_filename}")
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(
+        log_queue, c_handler, f_handler, respect_handler_level=True
+    )
+    listener.start()
+    if not _log_listeners:
+        atexit.register(_stop_listeners)
+    _log_listeners[logger_name] = listener
+    logger.addHandler(_LocalQueueHandler(log_queue))
+    if logger.level == logging.NOTSET:  # keep a level set before, e.g. --quiet
+        logger.setLevel(logging.INFO)
+    logger.debug("logger initialized - %s", logger_filename)
     return logger
 
 
+class _LevelListener(QueueListener):
+    """
+    drops worker records below the parent logger's level at the time
+    """
+
+    def __init__(self, queue, *handlers, logger: logging.Logger) -> None:
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.logger = logger
+
+    def handle(self, record: logging.LogRecord) -> None:
+        if record.levelno >= self.logger.getEffectiveLevel():
+            super().handle(record)
+
+
+@contextmanager
+def worker_log_queue(name: str = APP_NAME) -> Iterator["multiprocessing.Queue"]:
+    """
+    a process-safe queue for the records of pool workers (see
+    init_worker_logging), written by the handlers of logger name
+    at or above that logger's level
+    """
+    mp_queue: multiprocessing.Queue = multiprocessing.Queue()
+    handlers = _log_listeners[name].handlers if name in _log_listeners else ()
+    listener = _LevelListener(mp_queue, *handlers, logger=logging.getLogger(name))
+    listener.start()
+    try:
+        yield mp_queue
+    finally:
+        listener.stop()
+        mp_queue.close()
+
+
+def init_worker_logging(
+    mp_queue: Optional["multiprocessing.Queue"],
+    level: int = logging.INFO,
+    name: str = APP_NAME,
+) -> None:
+    """
+    in a worker process: send the records of logger name to mp_queue at level
+    (a forked worker inherits an in-process queue that nobody reads there)
+    """
+    logger = logging.getLogger(name)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    if mp_queue is not None:
+        logger.addHandler(QueueHandler(mp_queue))
+    else:
+        logger.addHandler(logging.NullHandler())
+    logger.setLevel(level)
+
+
 if __name__ == "__main__":
     pass
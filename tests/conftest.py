@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the ppys modules import each other by their flat names, as cli.py runs them
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "ppys"))
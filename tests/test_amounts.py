@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import amounts
+
+CASES = [
+    ("1,234.50", 123450),
+    ("+12.00", 1200),
+    ("-3.5", -350),
+    ("3.50-", -350),
+    ("1,234.50-", -123450),
+    (" 7.25 ", 725),
+    ("1,000,000.00", 100000000),
+    ("0.1", 10),
+    (".05", 5),
+    ("12", 1200),
+    (12.5, 1250),
+    (3, 300),
+    ("", pd.NA),
+    ("   ", pd.NA),
+    (None, pd.NA),
+    (np.nan, pd.NA),
+    ("1.005", pd.NA),
+    ("12.345", pd.NA),
+    ("abc", pd.NA),
+    ("1_000", pd.NA),
+    ("90,000,000,000,000,000.00", 9000000000000000000),
+    ("1e17", pd.NA),  # 1e19 cents, past int64
+    ("100,000,000,000,000,000.00-", pd.NA),
+    ("1e400", pd.NA),
+]
+
+
+def _expected(values: list) -> pd.Series:
+    return pd.Series(values, dtype="Int64")
+
+
+@pytest.mark.parametrize("size", [1, amounts.SHORT_COLUMN * 2])
+def test_parse_amounts(size):
+    """
+    the per cell path (short columns) and the vectorized one agree
+    """
+    values = [x for x, _ in CASES] * size
+    res = amounts.parse_amounts(pd.Series(values, dtype=object))
+    pd.testing.assert_series_equal(res, _expected([y for _, y in CASES] * size))
+
+
+@pytest.mark.parametrize("value,cents", CASES)
+def test_parse_amount(value, cents):
+    assert amounts.parse_amount(value) == (None if cents is pd.NA else cents)
+
+
+def test_parse_amounts_keeps_index():
+    values = pd.Series(["1.00", "2.00-"], index=[5, 7])
+    res = amounts.parse_amounts(values)
+    assert res.index.tolist() == [5, 7]
+    assert res.tolist() == [100, -200]
+
+
+@pytest.mark.parametrize("value", [None, np.nan, pd.NA, "", " \t"])
+def test_is_blank(value):
+    assert amounts.is_blank(value)
+
+
+def test_cents_round_trip():
+    value = amounts.cents_to_decimal(-123450)
+    assert str(value) == "-1234.50"
+    assert amounts.decimal_to_cents(value) == -123450
@@ -0,0 +1,266 @@
+import io
+import json
+import shutil
+import sys
+import types
+from importlib.util import find_spec
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from pypdf import PdfReader
+
+import backends
+import synth
+from main import FLEXHR_AREAS, SAP_AREAS, FlexHRPayslip, SAPPayslip
+
+FLEXHR_TABLES = {
+    "date": [["PERIOD", ": Mar-2020"]],
+    "paytable": [
+        ["BASIC PAY", "5,201.00"],
+        ["URGENT TASK ALLOWANCE (A)", "2,513.50"],
+        ["MOBILE PHONE SUBSIDY", "40.00"],
+    ],
+    "deductions": [
+        ["CPF CONTRIBUTION - EMPLOYEE", "-1,040.20"],
+        ["CHINESE DEVELOPMENT ASSISTANC", "-2.00"],
+        ["TOTAL DEDUCTIONS", "-1,042.20"],
+    ],
+    "pay_summary": [
+        ["DESCRIPTION", "CURRENT EARNING"],
+        ["Employee CPF", "1,040.20"],
+        ["Employer CPF", "884.17"],
+    ],
+}
+SAP_TABLES = {
+    "date": [["01/03/2020 to 31/03/2020"]],
+    "paytable": [
+        ["Basic Salary", "6,000.00"],
+        ["Mobile Phone Subsidy", "50.00"],
+        ["Fund - CDAC", "-2.00"],
+    ],
+    "pay_summary": [["CPF Employee", "1,200.00"], ["CPF Employer", "1,020.00"]],
+}
+# x offset of the amount column in each area, as in synth
+FLEXHR_DX = {"date": 60, "paytable": 200, "deductions": 200, "pay_summary": 150}
+SAP_DX = {"date": 0, "paytable": 150, "pay_summary": 70}
+
+
+def _pdf(areas: dict, tables: dict, dx: dict) -> bytes:
+    items = []
+    for name, rows in tables.items():
+        pairs = [(row[0], row[1] if len(row) > 1 else "") for row in rows]
+        items += synth._rows(areas[name], pairs, dx[name])
+    return synth.make_pdf(items)
+
+
+@pytest.fixture(scope="module")
+def payslips(tmp_path_factory) -> dict:
+    outdir = tmp_path_factory.mktemp("payslips")
+    files = {
+        FlexHRPayslip: _pdf(FLEXHR_AREAS, FLEXHR_TABLES, FLEXHR_DX),
+        SAPPayslip: _pdf(SAP_AREAS, SAP_TABLES, SAP_DX),
+    }
+    paths = {}
+    for cls, data in files.items():
+        paths[cls] = outdir / f"{cls.layout}.pdf"
+        paths[cls].write_bytes(data)
+    return paths
+
+
+def _rows(df: pd.DataFrame, header: bool) -> list[list[str]]:
+    rows = df.astype(object).where(df.notna(), "").values.tolist()
+    return ([list(df.columns)] if header else []) + rows
+
+
+@pytest.mark.parametrize(
+    "cls,expected", [(FlexHRPayslip, FLEXHR_TABLES), (SAPPayslip, SAP_TABLES)]
+)
+def test_text_backend_tables(payslips, cls, expected):
+    reader = PdfReader(payslips[cls])
+    tables = backends.get_backend("text").extract(reader, cls.areas, cls.table_headers)
+    assert set(tables) == set(expected)
+    for name, rows in expected.items():
+        header = name in cls.table_headers
+        assert _rows(tables[name], header) == rows, name
+
+
+def test_text_backend_in_memory(payslips):
+    data = payslips[FlexHRPayslip].read_bytes()
+    backend = backends.get_backend("text")
+    df = backend.read_area(PdfReader(io.BytesIO(data)), FLEXHR_AREAS["paytable"])
+    assert _rows(df, False) == FLEXHR_TABLES["paytable"]
+
+
+def test_text_backend_crunch(payslips):
+    ps = FlexHRPayslip(payslips[FlexHRPayslip], backend=backends.get_backend("text"))
+    ps.get_layout_tables()
+    row = ps.parse().crunch()
+    assert row.date.strftime("%Y-%m") == "2020-03"
+    assert row.basic_pay == 520100
+    assert row.allowances_work == 251350
+    assert row.allowances_pckg == 4000
+    assert row.cpf_employee == 104020
+    assert row.deductable_cdc == 200
+    assert row.accounting_pay == 520100 + 4000 - 104220
+
+    ps = SAPPayslip(payslips[SAPPayslip], backend=backends.get_backend("text"))
+    ps.get_layout_tables()
+    row = ps.parse().crunch()
+    assert row.date.strftime("%Y-%m-%d") == "2020-03-31"
+    assert row.basic_pay == 600000
+    assert row.cpf_employer == 102000
+
+
+def test_parity_report_columns(payslips):
+    fp = payslips[FlexHRPayslip]
+    df = backends.parity_report(
+        [fp], FLEXHR_AREAS, FlexHRPayslip.table_headers, "text", "text"
+    )
+    # reference and candidate share the name, so a single shape column
+    assert df.columns.tolist() == ["file", "area", "text_shape", "match"]
+    assert df["area"].tolist() == list(FLEXHR_AREAS)
+    assert df["match"].all()
+
+
+def _tabula_available() -> bool:
+    return find_spec("tabula") is not None and shutil.which("java") is not None
+
+
+@pytest.mark.skipif(not _tabula_available(), reason="needs tabula-py and java")
+@pytest.mark.parametrize("cls", [FlexHRPayslip, SAPPayslip])
+def test_parity_text_vs_tabula(payslips, cls):
+    df = backends.parity_report(
+        [payslips[cls]], cls.areas, cls.table_headers, "subprocess", "text"
+    )
+    assert len(df) == len(cls.areas)
+    assert df["match"].all(), df[~df["match"]]
+
+
+def _json_table(rows: list[list[str]]) -> dict:
+    return {"data": [[{"text": text} for text in row] for row in rows]}
+
+
+def test_table_to_dataframe_header():
+    table = _json_table(
+        [
+            ["", "CURRENT EARNING", "CURRENT EARNING", ""],
+            ["Employee CPF", "1,040.20", "", "x"],
+            ["", "884.17", "2", ""],
+        ]
+    )
+    df = backends.table_to_dataframe(table, header=0)
+    assert df.columns.tolist() == [
+        "Unnamed: 0",
+        "CURRENT EARNING",
+        "CURRENT EARNING.1",
+        "Unnamed: 1",
+    ]
+    # a repeated header still selects a single column
+    assert isinstance(df["CURRENT EARNING"], pd.Series)
+    assert pd.isna(df.iloc[1, 0]) and pd.isna(df.iloc[0, 2])
+    assert df["CURRENT EARNING.1"].dtype == "float64"
+
+
+def test_table_to_dataframe_empty():
+    assert backends.table_to_dataframe({"data": []}, header=0).empty
+
+
+@pytest.mark.skipif(find_spec("tabula") is None, reason="needs tabula-py")
+def test_extract_falls_back_per_area(monkeypatch):
+    """
+    a single pass that does not return one table per area is retried per area
+    """
+    calls = []
+
+    def read_pdf(filepath, area, **kwargs):
+        calls.append(area)
+        if isinstance(area[0], list):
+            return {}
+        return [{"data": [[{"text": "BASIC PAY"}, {"text": "1.00"}]]}]
+
+    monkeypatch.setattr(backends.tabula.io, "read_pdf", read_pdf)
+    tables = backends.TabulaBackend().extract("x.pdf", FLEXHR_AREAS)
+    assert set(tables) == set(FLEXHR_AREAS)
+    assert calls == [list(FLEXHR_AREAS.values())] + list(FLEXHR_AREAS.values())
+    assert tables["paytable"].values.tolist() == [["BASIC PAY", 1.0]]
+
+
+@pytest.mark.skipif(find_spec("tabula") is None, reason="needs tabula-py")
+def test_extract_one_stream_table_per_area(monkeypatch):
+    """
+    tables come back in area order, one each, as long as the mode is stream
+    """
+    kwargs_seen = {}
+
+    def read_pdf(filepath, area, **kwargs):
+        kwargs_seen.update(kwargs)
+        return [{"data": [[{"text": str(i)}]]} for i in range(len(area))]
+
+    monkeypatch.setattr(backends.tabula.io, "read_pdf", read_pdf)
+    tables = backends.TabulaBackend().extract("x.pdf", FLEXHR_AREAS)
+    assert kwargs_seen["stream"] is True
+    assert not kwargs_seen.get("lattice")
+    assert {k: v.iat[0, 0] for k, v in tables.items()} == {
+        name: i for i, name in enumerate(FLEXHR_AREAS)
+    }
+
+
+class FakeVm:
+    """
+    tabula.backend.TabulaVm without a JVM, loaded says whether tabula-java did
+    """
+
+    loaded = True
+    calls: list = []
+
+    def __init__(self, java_options, silent) -> None:
+        self.tabula = object() if self.loaded else None
+
+    def call_tabula_java(self, options, path) -> str:
+        with open(path, "rb") as f:
+            self.calls.append((options.build_option_list(), path, f.read()))
+        return json.dumps([{"data": [[{"text": "BASIC PAY"}, {"text": "1.00"}]]}])
+
+
+@pytest.fixture
+def fake_jvm(monkeypatch):
+    pytest.importorskip("tabula")
+    started = {"jvm": False}
+
+    def start(*args, **kwargs):
+        started["jvm"] = True
+        return FakeVm(*args, **kwargs)
+
+    jpype = types.SimpleNamespace(
+        isJVMStarted=lambda: started["jvm"],
+        shutdownJVM=lambda: started.update(jvm=False),
+    )
+    monkeypatch.setitem(sys.modules, "jpype", jpype)
+    monkeypatch.setattr(backends, "TabulaVm", start)
+    monkeypatch.setattr(backends, "_jvm_shut_down", False)
+    FakeVm.calls = []
+    return started
+
+
+def test_jvm_backend_calls_its_own_vm(fake_jvm, monkeypatch, payslips):
+    def no_subprocess(*args, **kwargs):
+        raise AssertionError("tabula.read_pdf is not used by the jvm backend")
+
+    monkeypatch.setattr(backends.tabula.io, "read_pdf", no_subprocess)
+    data = payslips[FlexHRPayslip].read_bytes()
+    with backends.PersistentTabulaBackend() as backend:
+        df = backend.read_area(io.BytesIO(data), FLEXHR_AREAS["paytable"])
+        assert df.values.tolist() == [["BASIC PAY", 1.0]]
+    options, path, sent = FakeVm.calls[0]
+    assert "--format" in options and "JSON" in options
+    assert "--stream" in options
+    assert sent == data
+    assert not Path(path).exists()  # the temporary copy is gone
+    assert not fake_jvm["jvm"]
+
+
+def test_jvm_backend_unavailable_without_tabula_java(fake_jvm, monkeypatch):
+    monkeypatch.setattr(FakeVm, "loaded", False)
+    with pytest.raises(backends.BackendUnavailable):
+        backends.PersistentTabulaBackend()
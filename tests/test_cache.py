@@ -0,0 +1,70 @@
+import sqlite3
+import time
+
+import pandas as pd
+import pytest
+
+from cache import PayslipCache
+
+
+def _fill(cache: PayslipCache, n: int) -> None:
+    for i in range(n):
+        cache.put_layout(f"h{i}", "FlexHRPayslip")
+        cache.put(f"h{i}", "layout", {"paytable": pd.DataFrame({0: [i]})})
+        # ordered last_used, h0 is the least recently used
+        cache.conn.execute(
+            "UPDATE payslips SET last_used=? WHERE content_hash=?",
+            (time.time() - (n - i) * 86400, f"h{i}"),
+        )
+    cache.commit()
+
+
+def test_evict_max_entries(tmp_path):
+    with PayslipCache(tmp_path / "c.sqlite", max_entries=2) as cache:
+        _fill(cache, 5)
+        assert cache.evict() == 6  # 3 payslips and their 3 layouts
+        assert cache.counts() == {"layouts": 2, "payslips layout": 2}
+        assert cache.get("h0", "layout") is None
+        assert cache.get("h4", "layout") is not None
+        assert cache.get_layout("h0") == ""
+        assert cache.get_layout("h4") == "FlexHRPayslip"
+
+
+def test_evict_max_age(tmp_path):
+    with PayslipCache(tmp_path / "c.sqlite", max_age_days=2.5) as cache:
+        _fill(cache, 5)
+        cache.evict()
+        assert cache.counts() == {"layouts": 2, "payslips layout": 2}
+
+
+def test_no_limits_keeps_everything(tmp_path):
+    with PayslipCache(tmp_path / "c.sqlite") as cache:
+        _fill(cache, 5)
+        assert cache.evict() == 0
+    with PayslipCache(tmp_path / "c.sqlite") as cache:
+        assert cache.counts() == {"layouts": 5, "payslips layout": 5}
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    with PayslipCache(tmp_path / "c.sqlite") as cache:
+        _fill(cache, 2)
+        cache.conn.execute(
+            "UPDATE payslips SET tables=? WHERE content_hash='h0'", (b"not a pickle",)
+        )
+        assert cache.get("h0", "layout") is None
+        assert cache.misses == 1
+        assert cache.counts() == {"layouts": 2, "payslips layout": 1}
+        assert cache.get("h1", "layout") is not None
+
+
+def test_read_only_neither_creates_nor_evicts(tmp_path):
+    filepath = tmp_path / "c.sqlite"
+    with PayslipCache(filepath) as cache:
+        _fill(cache, 5)
+    with PayslipCache(filepath, max_entries=1, read_only=True) as cache:
+        assert cache.counts() == {"layouts": 5, "payslips layout": 5}
+    with PayslipCache(filepath, read_only=True) as cache:
+        assert cache.counts() == {"layouts": 5, "payslips layout": 5}
+    with pytest.raises(sqlite3.OperationalError):
+        PayslipCache(tmp_path / "missing.sqlite", read_only=True)
+    assert not (tmp_path / "missing.sqlite").exists()
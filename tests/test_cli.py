@@ -0,0 +1,66 @@
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import synth
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def checkout(tmp_path) -> Path:
+    """
+    cli.py and ppys/ alone, as in a fresh clone: no resources/, no .env
+    """
+    root = tmp_path / "checkout"
+    root.mkdir()
+    shutil.copy(REPO / "cli.py", root)
+    shutil.copytree(
+        REPO / "ppys", root / "ppys", ignore=shutil.ignore_patterns("__pycache__")
+    )
+    return root
+
+
+def _cli(checkout: Path, *args: str) -> subprocess.CompletedProcess:
+    env = {k: v for k, v in os.environ.items() if not k.startswith("PASSWORD")}
+    return subprocess.run(
+        [sys.executable, str(checkout / "cli.py"), *args],
+        cwd=checkout,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+
+
+@pytest.mark.parametrize("mode,suffix", [("batch", ".csv"), ("stream", ".csv")])
+def test_parse_fresh_checkout(checkout, tmp_path, mode, suffix):
+    synth.generate(tmp_path / "payslips", 4)
+    output = tmp_path / f"out{suffix}"
+    res = _cli(
+        checkout,
+        "-q",
+        "parse",
+        str(tmp_path / "payslips"),
+        "--mode",
+        mode,
+        "--backend",
+        "text",
+        "-o",
+        str(output),
+    )
+    assert res.returncode == 0, res.stderr
+    df = pd.read_csv(output)
+    assert len(df) == 4
+    assert (checkout / ".ppys_cache.sqlite").is_file()
+
+
+def test_help_fresh_checkout(checkout):
+    res = _cli(checkout, "--help")
+    assert res.returncode == 0, res.stderr
+    assert "parse" in res.stdout
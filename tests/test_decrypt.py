@@ -0,0 +1,91 @@
+import datetime
+import io
+import random
+import subprocess
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+import batch
+import decrypt
+import synth
+from main import FlexHRPayslip
+from pdfobject import PdfObject
+
+PASSWORD = "s3cret-pw"
+
+
+@pytest.fixture
+def encrypted() -> bytes:
+    data = synth.flexhr_payslip(datetime.date(2020, 3, 1), random.Random(0))
+    writer = PdfWriter(clone_from=PdfReader(io.BytesIO(data)))
+    writer.encrypt(PASSWORD, algorithm="RC4-128")  # AES needs cryptography
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+class RecordingBackend:
+    """
+    stands in for tabula: reads the file itself, records what it was given
+    """
+
+    name = "recording"
+    needs_reader = False
+
+    def __init__(self) -> None:
+        self.calls: list[tuple] = []
+
+    def extract(self, source, areas, headers=None, **kwargs):
+        self.calls.append((source, kwargs))
+        raise subprocess.CalledProcessError(
+            1, ["java", "-jar", "tabula.jar", "--password", PASSWORD, "x.pdf"]
+        )
+
+
+def test_decrypted_copy(encrypted):
+    reader, password = decrypt.open_pdf(io.BytesIO(encrypted), (PASSWORD,))
+    assert password == PASSWORD
+    plain = PdfReader(io.BytesIO(decrypt.decrypted_copy(reader)))
+    assert not plain.is_encrypted
+    assert "PERIOD" in plain.pages[0].extract_text()
+
+
+def test_tabula_gets_decrypted_bytes(encrypted):
+    backend = RecordingBackend()
+    ps = FlexHRPayslip(encrypted, backend=backend, passwords=(PASSWORD,))
+    with pytest.raises(subprocess.CalledProcessError):
+        ps.get_tables(ps.areas)
+    ((source, kwargs),) = backend.calls
+    assert kwargs == {}
+    data = source.read()
+    assert PASSWORD.encode() not in data
+    assert not PdfReader(io.BytesIO(data)).is_encrypted
+
+
+def test_errors_do_not_carry_the_command_line(encrypted, monkeypatch):
+    backend = RecordingBackend()
+    monkeypatch.setattr(batch.backends, "get_backend", lambda name="": backend)
+    monkeypatch.setenv(decrypt.PASSWORD_ENV, PASSWORD)
+    decrypt.get_passwords.cache_clear()
+    try:
+        outcome = batch.parse_one(FlexHRPayslip, "enc.pdf", "recording", encrypted)
+    finally:
+        decrypt.get_passwords.cache_clear()
+    assert outcome.error_type == "CalledProcessError"
+    assert PASSWORD not in outcome.error
+    assert "tabula.jar" not in outcome.error
+
+
+def test_wrong_password(encrypted):
+    with pytest.raises(decrypt.WrongPassword):
+        decrypt.open_pdf(io.BytesIO(encrypted), ("nope",))
+
+
+def test_wrong_password_names_the_file(encrypted, tmp_path):
+    filepath = tmp_path / "enc.pdf"
+    filepath.write_bytes(encrypted)
+    with pytest.raises(decrypt.WrongPassword, match="enc.pdf"):
+        PdfObject(filepath, passwords=("nope",)).reader
+    with pytest.raises(decrypt.WrongPassword, match="march.pdf"):
+        PdfObject(encrypted, passwords=("nope",), name="archive/march.pdf").reader
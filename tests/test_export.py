@@ -0,0 +1,59 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+import export
+import sinks
+from records import FIELDS, PayslipRecord, RecordAccumulator
+
+RECORDS = [
+    (
+        "b.pdf",
+        PayslipRecord(datetime.datetime(2022, 2, 28), basic_pay=500000, aws_pay=1),
+    ),
+    (
+        "a.pdf",
+        PayslipRecord(
+            datetime.datetime(2022, 1, 31), basic_pay=123456, cpf_employee=-5
+        ),
+    ),
+]
+
+
+def _frame() -> pd.DataFrame:
+    acc = RecordAccumulator()
+    for source, record in sorted(RECORDS, key=lambda x: x[1].date):
+        acc.append(record, source=source)
+    return acc.to_frame()
+
+
+def _check(df: pd.DataFrame) -> None:
+    expected = _frame()
+    assert df.index.tolist() == expected.index.tolist()
+    assert df["source"].tolist() == expected["source"].tolist()
+    assert df[FIELDS].to_numpy().tolist() == expected[FIELDS].to_numpy().tolist()
+
+
+@pytest.mark.parametrize("suffix", [".sqlite", ".csv", ".parquet", ".xlsx"])
+def test_export_round_trip(tmp_path, suffix):
+    if suffix == ".parquet":
+        pytest.importorskip("pyarrow")
+    if suffix == ".xlsx":
+        pytest.importorskip("openpyxl")
+    filepath = tmp_path / f"out{suffix}"
+    export.export_frame(_frame(), filepath)
+    _check(export.read_frame(filepath))
+
+
+@pytest.mark.parametrize("suffix", [".sqlite", ".csv"])
+def test_sink_read_by_export(tmp_path, suffix):
+    """
+    a streamed output (int cents in sqlite) reads back like an exported one
+    """
+    filepath = tmp_path / f"stream{suffix}"
+    with sinks.get_sink(filepath) as sink:
+        for source, record in RECORDS:
+            sink.write(source, record)
+    _check(export.read_frame(filepath))
+    _check(sinks.get_sink(filepath).read())
@@ -0,0 +1,46 @@
+import datetime
+
+import pytest
+
+from history import HistoryStore
+from records import PayslipRecord
+
+
+def _record(year: int, month: int, net: int) -> PayslipRecord:
+    return PayslipRecord(datetime.datetime(year, month, 28), actual_net_pay=net)
+
+
+@pytest.fixture
+def store(tmp_path):
+    with HistoryStore(tmp_path / "h.sqlite") as store:
+        store.add(
+            [("a1.pdf", _record(2015, 1, 100)), ("a2.pdf", _record(2015, 2, 200))]
+        )
+        store.add([("b1.pdf", _record(2015, 1, 1000))], employee="bob")
+        store.add([("a3.pdf", _record(2016, 1, 300))])
+        yield store
+
+
+@pytest.mark.parametrize("start", ["2015", "2015-01", "2015-01-01", "2015-01-15"])
+def test_monthly_start_keeps_its_month(store, start):
+    df = store.rollup("monthly", "", start, "2015-02", cents=True)
+    assert df["actual_net_pay"].tolist() == [100, 200]
+
+
+@pytest.mark.parametrize("end", ["2015", "2015-12", "2015-12-31"])
+def test_yearly_takes_dates(store, end):
+    df = store.rollup("yearly", None, "2015-01-01", end, cents=True)
+    assert df["actual_net_pay"].tolist() == [100 + 200, 1000]
+
+
+@pytest.mark.parametrize("end,n", [("2015", 2), ("2015-01", 1), ("2015-01-28", 1)])
+def test_payslips_end_covers_its_period(store, end, n):
+    assert len(store.payslips("", "2015", end)) == n
+
+
+def test_year_to_date_employee(store):
+    assert store.year_to_date("2015-06", "", cents=True)["actual_net_pay"] == 300
+    assert store.year_to_date("2015-01", "bob", cents=True)["payslips"] == 1
+    everyone = store.year_to_date("2015-06", cents=True)
+    assert everyone["actual_net_pay"] == 1300
+    assert everyone["payslips"] == 3
@@ -0,0 +1,118 @@
+import sys
+import time
+from pathlib import Path
+
+import synth
+from cache import PayslipCache
+from main import LAYOUTS, FlexHRPayslip
+from scheduler import Quarantine, Scheduler
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cli  # noqa: E402
+
+
+class HangOnce(FlexHRPayslip):
+    """
+    hangs the first time it classifies a file, flag marks that it did
+    workers are forked, so the flag is the only state they share
+    """
+
+    flag: Path = Path()
+
+    @classmethod
+    def match_layout(cls, text: str) -> int:
+        if not cls.flag.exists():
+            cls.flag.touch()
+            time.sleep(60)
+        return super().match_layout(text)
+
+
+class Broken(FlexHRPayslip):
+    def get_pay_date(self):
+        raise KeyError("PERIOD")
+
+
+def _payslips(n: int = 2) -> list[tuple[str, bytes]]:
+    return list(synth.iter_payslips(n, layouts=("flexhr",)))
+
+
+def _scheduler(layouts: list[type], **kwargs) -> Scheduler:
+    kwargs = {"file_timeout": 1.0, "stage_seconds": {}, **kwargs}
+    return Scheduler(layouts, backend_name="text", **kwargs)
+
+
+def test_timeout_is_retried(tmp_path):
+    HangOnce.flag = tmp_path / "hung"
+    scheduler = _scheduler([HangOnce], retries=1)
+    result = scheduler.run(_payslips(1))
+    assert scheduler.report.timeouts == 1
+    assert scheduler.report.retries == 1
+    assert scheduler.report.worker_restarts == 1
+    assert len(result.parsed) == 1
+    assert not result.failures
+
+
+def test_timeout_quarantined_after_retries(tmp_path):
+    HangOnce.flag = tmp_path / "hung"
+    with Quarantine(tmp_path / "q.sqlite") as quarantine:
+        scheduler = _scheduler([HangOnce], retries=0, quarantine=quarantine)
+        result = scheduler.run(_payslips(1))
+        assert len(result.failures) == 1
+        assert [x[1] for x in quarantine.entries()] == ["Timeout"]
+
+
+def test_quarantine_skip_and_release(tmp_path):
+    items = _payslips(2)
+    with Quarantine(tmp_path / "q.sqlite") as quarantine:
+        scheduler = _scheduler([Broken], quarantine=quarantine)
+        scheduler.run(items)
+        # not retryable: quarantined after one attempt
+        assert scheduler.report.retries == 0
+        assert [x[:2] for x in quarantine.entries()] == [
+            (name, "KeyError") for name, _ in items
+        ]
+        scheduler.run(items)
+        assert scheduler.report.skipped == 2
+        assert quarantine.release([items[0][0]]) == 1
+        scheduler = _scheduler(LAYOUTS, quarantine=quarantine)
+        result = scheduler.run(items)
+        assert scheduler.report.skipped == 1
+        assert result.parsed == [Path(items[0][0])]
+
+
+def test_config_errors_not_quarantined(tmp_path):
+    items = [("blank.pdf", synth.make_pdf([(50, 700, "not a payslip")]))]
+    with Quarantine(tmp_path / "q.sqlite") as quarantine:
+        scheduler = _scheduler(LAYOUTS, quarantine=quarantine)
+        result = scheduler.run(items)
+        assert result.failures == [(Path("blank.pdf"), "unknown payslip layout")]
+        assert quarantine.entries() == []
+        assert scheduler.report.quarantined == []
+
+
+def test_cached_payslips_are_not_scheduled(tmp_path):
+    items = _payslips(2)
+    with PayslipCache(tmp_path / "c.sqlite") as cache:
+        first = _scheduler(LAYOUTS, cache=cache).run(items)
+        scheduler = _scheduler(LAYOUTS, cache=cache)
+        second = scheduler.run(items)
+    assert scheduler.report.cached == 2
+    assert scheduler.report.latencies == []  # no worker was asked
+    assert second.data.equals(first.data)
+
+
+def test_cli_release(tmp_path, capsys):
+    filepath = tmp_path / "q.sqlite"
+    with Quarantine(filepath) as quarantine:
+        for name, data in _payslips(2):
+            quarantine.add(Path(name), data, "Timeout", "no result", 2)
+    cli.main(["quarantine", str(filepath)])
+    assert "flexhr_000000.pdf: Timeout" in capsys.readouterr().out
+    cli.main(["quarantine", str(filepath), "--release", "flexhr_000000.pdf"])
+    out = capsys.readouterr().out
+    assert "released 1 payslips" in out
+    assert "flexhr_000000.pdf" not in out
+    cli.main(["quarantine", str(filepath), "--release"])
+    assert "released 1 payslips" in capsys.readouterr().out
+    with Quarantine(filepath) as quarantine:
+        assert quarantine.entries() == []
@@ -0,0 +1,107 @@
+import asyncio
+import http.client
+import json
+import threading
+import time
+
+import service
+import synth
+
+PAYSLIPS = list(synth.iter_payslips(8))
+
+
+def _serve(client, **options):
+    """
+    run client(svc, port) against a text backend service on a free local port
+    """
+
+    async def run():
+        svc = service.PayslipService("text", **options)
+        await svc.start(port=0)
+        try:
+            return await client(svc, svc.address[1])
+        finally:
+            await svc.close()
+
+    return asyncio.run(run())
+
+
+def _post(port: int, data: bytes, name: str = "") -> tuple[int, dict, dict]:
+    """
+    (status, headers, json body), blocking: run it in a thread
+    """
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request("POST", f"/parse?name={name}", body=data)
+        res = conn.getresponse()
+        return res.status, dict(res.getheaders()), json.loads(res.read())
+    finally:
+        conn.close()
+
+
+def test_parse():
+    async def client(svc, port):
+        name, data = PAYSLIPS[0]
+        return await asyncio.to_thread(service.post_pdf, data, name, port=port)
+
+    status, body = _serve(client)
+    assert status == 200
+    assert body["source"] == "flexhr_000000.pdf"
+    assert body["layout"] == "FlexHRPayslip"
+    assert body["record"]["date"].startswith("2015-01")
+
+
+def test_junk_is_unprocessable():
+    async def client(svc, port):
+        return await asyncio.to_thread(_post, port, b"not a pdf", "junk.pdf")
+
+    status, _, body = _serve(client)
+    assert status == 422
+    assert body["source"] == "junk.pdf"
+    assert body["error"]
+
+
+def test_concurrent_uploads_are_batched():
+    async def client(svc, port):
+        res = await asyncio.gather(
+            *(asyncio.to_thread(_post, port, data, name) for name, data in PAYSLIPS)
+        )
+        return res, svc.stats
+
+    res, stats = _serve(client, batch_size=4, batch_wait=0.5)
+    assert [x[0] for x in res] == [200] * len(PAYSLIPS)
+    assert [x[2]["source"] for x in res] == [name for name, _ in PAYSLIPS]
+    assert stats.parsed == len(PAYSLIPS)
+    assert stats.largest_batch > 1
+    assert stats.batches < len(PAYSLIPS)
+
+
+def test_full_queue_is_refused(monkeypatch):
+    gate = threading.Event()
+    parse_batch = service.parse_batch
+
+    def held_parse_batch(items, backend_name=""):
+        gate.wait(30)
+        return parse_batch(items, backend_name)
+
+    monkeypatch.setattr(service, "parse_batch", held_parse_batch)
+
+    async def client(svc, port):
+        # held workers take at most 2 batches, 1 more waits for them and
+        # max_pending=1 queued: the rest of the uploads are refused
+        posts = [
+            asyncio.create_task(asyncio.to_thread(_post, port, data, name))
+            for name, data in PAYSLIPS
+        ]
+        deadline = time.monotonic() + 10
+        while svc.stats.requests < len(PAYSLIPS):
+            assert time.monotonic() < deadline, svc.stats
+            await asyncio.sleep(0.05)
+        gate.set()
+        return await asyncio.gather(*posts), svc.stats
+
+    res, stats = _serve(client, batch_size=1, batch_wait=0, max_pending=1)
+    refused = [x for x in res if x[0] == 503]
+    assert 1 <= len(refused) == stats.rejected < len(PAYSLIPS)
+    assert all(x[1]["Retry-After"] == "1" for x in refused)
+    assert sorted(x[0] for x in res if x[0] != 503) == [200] * stats.parsed
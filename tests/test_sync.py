@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+import export
+import main
+import synth
+from cache import PayslipCache
+from manifest import Manifest
+
+
+@pytest.fixture
+def payslips(tmp_path, monkeypatch):
+    """
+    three synthetic payslips to sync, with the parse cache kept in tmp_path
+    """
+    monkeypatch.setattr(
+        main, "open_cache", lambda *args: PayslipCache(tmp_path / "c.sqlite")
+    )
+    outdir = tmp_path / "payslips"
+    synth.generate(outdir, 3)
+    return outdir
+
+
+def _sync(payslips, output) -> dict[str, str]:
+    """
+    {file name: pay month} of the synced output
+    """
+    main.sync_payslips(backend_name="text", output=str(output), roots=[str(payslips)])
+    df = export.read_frame(output)
+    return {
+        os.path.basename(source): date.strftime("%Y-%m")
+        for source, date in zip(df["source"], df.index)
+    }
+
+
+def test_sync_add_modify_delete(payslips, tmp_path):
+    output = tmp_path / "out.csv"
+    names = [name for name, _ in synth.iter_payslips(3)]  # one month each
+    assert _sync(payslips, output) == dict(
+        zip(names, ["2015-01", "2015-02", "2015-03"])
+    )
+
+    # added
+    name, data = list(synth.iter_payslips(4))[3]
+    (payslips / name).write_bytes(data)
+    assert len(_sync(payslips, output)) == 4
+
+    # modified: the same file now holds a later payslip
+    modified = payslips / names[0]
+    modified.write_bytes(list(synth.iter_payslips(13))[12][1])
+    st = modified.stat()
+    os.utime(modified, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    months = _sync(payslips, output)
+    assert months[names[0]] == "2016-01"
+    assert len(months) == 4
+
+    # deleted
+    (payslips / names[1]).unlink()
+    months = _sync(payslips, output)
+    assert names[1] not in months
+    assert len(months) == 3
+
+
+def test_diff_file_deleted_during_walk(payslips, tmp_path):
+    filepaths = sorted(payslips.iterdir())
+    with Manifest(tmp_path / "m.sqlite") as manifest:
+        for fp in filepaths:
+            manifest.record(fp)
+        # touched, so diff has to stat and hash it again
+        os.utime(filepaths[1], ns=(0, 0))
+
+        def walk():
+            for fp in filepaths:
+                if fp == filepaths[1]:
+                    fp.unlink()  # gone between discovery and the check
+                yield fp
+
+        todo, removed = manifest.diff(walk())
+    assert todo == []
+    assert removed == [str(filepaths[1])]